@@ -1,19 +1,87 @@
+import argparse
+import sys
+import time
+from datetime import timedelta
+
 from config import CONFIG
-from src.csv_processing import (
-    process_console_csv,
-    process_dashboard_csv,
-    save_merged_csv,
-)
+from src.client_runner import default_workers, print_run_report, run_clients
+from src.parsed_cache import DEFAULT_CACHE_DIR
+from src.streaming_merge import DEFAULT_CHUNK_SIZE
+from src.tolerant_join import DEFAULT_MATCH_TOLERANCE
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def __main__():
-    print(f"Starting Auto-Anna CSV merger")
-    for files in CONFIG:
-        print(f"> Merging files for client {files.client}")
-        call_details = process_dashboard_csv(files.dashboard, files.carrier, client=files.client)
-        call_details = process_console_csv(files.console, files.carrier, call_details, client=files.client)
-        save_merged_csv(call_details, files.output)
-    print("All files merged successfully")
+    parser = argparse.ArgumentParser(description="Merge the dashboard and console files of every configured client.")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        default=default_workers(),
+        help="number of clients merged in parallel (default: number of CPUs, 1 merges them one by one)",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="merge every client, even those whose output is up to date with its inputs",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"where parsed input files are cached between runs (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="always parse the input files from scratch")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="merge each client one dial-start day at a time, for exports that do not fit in memory",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=positive_int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"rows read at a time with --streaming (default: {DEFAULT_CHUNK_SIZE})",
+    )
+    parser.add_argument(
+        "--match-tolerance",
+        type=float,
+        nargs="?",
+        const=DEFAULT_MATCH_TOLERANCE.total_seconds(),
+        metavar="SECONDS",
+        help="also join console rows to the dashboard call with the same numbers whose dial start is at most "
+        f"this far off (default when given without a value: {DEFAULT_MATCH_TOLERANCE.total_seconds():g})",
+    )
+    args = parser.parse_args()
+
+    print(f"Starting Auto-Anna CSV merger with {args.workers} worker(s)")
+    start = time.perf_counter()
+    results = run_clients(
+        CONFIG,
+        args.workers,
+        force=args.force,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        chunksize=args.chunk_size if args.streaming else None,
+        match_tolerance=timedelta(seconds=args.match_tolerance) if args.match_tolerance is not None else None,
+    )
+    print_run_report(results)
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"! {result.client} failed:\n{result.error}")
+
+    elapsed = time.perf_counter() - start
+    if failed:
+        print(f"{len(results) - len(failed)} of {len(results)} clients merged or up to date in {elapsed:.1f}s, {len(failed)} failed")
+        sys.exit(1)
+    skipped = sum(result.skipped for result in results)
+    print(f"All files merged successfully in {elapsed:.1f}s, {skipped} up to date client(s) skipped")
 
 
-__main__()
+if __name__ == "__main__":
+    __main__()
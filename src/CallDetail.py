@@ -1,11 +1,87 @@
 from src.utils import parse_phone_number, parse_iso_datetime, parse_time_duration, parse_call_memo, classify_number
-from src.idn_area_codes import EMERGENCY_NUMBERS, INTERNATIONAL_PHONE_PREFIXES
 import math
-from src.utils import call_hash, classify_number, format_datetime_as_human_readable, format_timedelta, format_username, parse_call_memo, parse_iso_datetime, parse_phone_number
-from src.international_rates import INTERNATIONAL_RATES
-from config import CONFIG
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from src.utils import NAIVE, NAT, call_identity, call_key, classify_number, format_datetime_as_human_readable, format_timedelta, format_username, parse_call_memo, parse_iso_datetime, parse_phone_number
+from src.client_registry import CLIENT_REGISTRY, ClientEntry
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+# Timezone of a call none of whose timestamps was set yet
+_UNSET = object()
+
+# Bits of CallDetail._pending, set while a field still holds its raw export
+# text, or for number_type and call_charge, while they were not computed yet
+_DIAL_START_AT = 1
+_DIAL_ANSWERED_AT = 2
+_DIAL_END_AT = 4
+_RINGING_TIME = 8
+_CALL_DURATION = 16
+_CALL_MEMO = 32
+_NUMBER_TYPE = 64
+_CALL_CHARGE = 128
+_ALL_PENDING = 255
+# Pending bit of every timestamp and duration field
+_TYPED_FIELDS = {
+    "dial_start_at": _DIAL_START_AT,
+    "dial_answered_at": _DIAL_ANSWERED_AT,
+    "dial_end_at": _DIAL_END_AT,
+    "ringing_time": _RINGING_TIME,
+    "call_duration": _CALL_DURATION,
+}
+_SECOND = timedelta(seconds=1)
+
+
+def _intern(value):
+    """Interns strings, so the few distinct call types, carriers, charges, ...
+    are stored once instead of once per call."""
+    return sys.intern(value) if type(value) is str else value
+
+
+def _parse_answered_at(text: str) -> Optional[datetime]:
+    return parse_iso_datetime(text) if text != "-" else None
+
 
 class CallDetail:
+    """One merged call.
+
+    Calls are slotted and kept compact: timestamps are stored as integer
+    microseconds since the epoch plus one timezone shared by the call's
+    timestamps, durations as integer seconds, and repeated strings are
+    interned. The properties hand out the usual datetime and timedelta objects.
+    Values that do not fit, like a timestamp in another timezone, are stored
+    as they are.
+
+    Fields are also lazy. __init__ keeps the export text of the timestamps,
+    durations and memo and parses each one on first access, so fields that a
+    later row overwrites are never parsed. The number type and the charge are
+    computed when first read, from the call as it is by then, so a call's
+    charge is only worked out once the merge is done with it.
+    """
+
+    __slots__ = (
+        "client",
+        "client_entry",
+        "sequence_id",
+        "user_name",
+        "call_from",
+        "call_to",
+        "call_type",
+        "_pending",
+        "_timezone",
+        "_dial_start_at",
+        "_dial_answered_at",
+        "_dial_end_at",
+        "_ringing_time",
+        "_call_duration",
+        "_call_memo",
+        "carrier",
+        "_number_type",
+        "_call_charge",
+    )
+
     def __init__(
         self,
         client:str,
@@ -22,24 +98,203 @@ class CallDetail:
         call_memo: str,
         call_charge: str,
         carrier: str,
+        client_entry: Optional[ClientEntry] = None,
     ):
-        self.client = client
+        self.client = _intern(client)
+        self.client_entry = client_entry if client_entry is not None else CLIENT_REGISTRY.get(client)
         self.sequence_id = sequence_id
-        self.user_name = user_name
+        self.user_name = _intern(user_name)
         self.call_from = parse_phone_number(call_from)  # Normalizing here
         self.call_to = parse_phone_number(call_to)      # Normalizing here
-        self.call_type = call_type
-        self.dial_start_at = parse_iso_datetime(dial_start_at)
-        self.dial_answered_at = (
-            parse_iso_datetime(dial_answered_at) if dial_answered_at != "-" else None
-        )
-        self.dial_end_at = parse_iso_datetime(dial_end_at)
-        self.ringing_time = parse_time_duration(ringing_time)
-        self.call_duration = parse_time_duration(call_duration)
-        self.call_memo = parse_call_memo(call_memo)
-        self.carrier = carrier
-        self.number_type = classify_number(self.call_to, self.call_type, self.call_from, self.call_to)
-        self.call_charge = self.calculate_call_charge()
+        self.call_type = _intern(call_type)
+        self._timezone = _UNSET
+        # Kept as text until first accessed, see the class docstring
+        self._pending = _ALL_PENDING
+        self._dial_start_at = dial_start_at
+        self._dial_answered_at = dial_answered_at
+        self._dial_end_at = dial_end_at
+        self._ringing_time = ringing_time
+        self._call_duration = call_duration
+        self._call_memo = call_memo
+        self.carrier = _intern(carrier)
+
+    @classmethod
+    def from_parsed(
+        cls,
+        client: str,
+        sequence_id: str,
+        user_name: str,
+        call_from: int | str,
+        call_to: int | str,
+        call_type: str,
+        dial_start_at: datetime,
+        dial_answered_at: Optional[datetime],
+        dial_end_at: datetime,
+        ringing_time: timedelta,
+        call_duration: timedelta,
+        call_memo: str,
+        carrier: str,
+        number_type: Optional[str] = None,
+        call_charge: Optional[str] = None,
+        client_entry: Optional[ClientEntry] = None,
+    ) -> "CallDetail":
+        """Builds a CallDetail from values that were already normalized column-wise,
+        skipping the per-field string parsing done in __init__. A number_type
+        classified and a call_charge computed in batch are used as is, missing
+        ones are computed when first read."""
+        call_detail = cls.__new__(cls)
+        call_detail.client = _intern(client)
+        call_detail.client_entry = client_entry if client_entry is not None else CLIENT_REGISTRY.get(client)
+        call_detail.sequence_id = sequence_id
+        call_detail.user_name = _intern(user_name)
+        call_detail.call_from = call_from
+        call_detail.call_to = call_to
+        call_detail.call_type = _intern(call_type)
+        call_detail._timezone = _UNSET
+        call_detail._pending = 0
+        call_detail.dial_start_at = dial_start_at
+        call_detail.dial_answered_at = dial_answered_at
+        call_detail.dial_end_at = dial_end_at
+        call_detail.ringing_time = ringing_time
+        call_detail.call_duration = call_duration
+        call_detail.call_memo = call_memo
+        call_detail.carrier = _intern(carrier)
+        if number_type is None:
+            call_detail._pending |= _NUMBER_TYPE
+        else:
+            call_detail.number_type = number_type
+        if call_charge is None:
+            call_detail._pending |= _CALL_CHARGE
+        else:
+            call_detail.call_charge = call_charge
+        return call_detail
+
+    def _encode_timestamp(self, value):
+        if type(value) is not datetime:
+            return value
+        if self._timezone is _UNSET:
+            self._timezone = value.tzinfo
+        if value.tzinfo != self._timezone:
+            return value
+        if value.tzinfo is None:
+            return (value - _EPOCH) // _MICROSECOND
+        return (value - _EPOCH_UTC) // _MICROSECOND
+
+    def _decode_timestamp(self, value):
+        if type(value) is not int:
+            return value
+        if self._timezone is None:
+            return _EPOCH + timedelta(microseconds=value)
+        return (_EPOCH_UTC + timedelta(microseconds=value)).astimezone(self._timezone)
+
+    @staticmethod
+    def _encode_duration(value):
+        if type(value) is timedelta and not value.microseconds:
+            return value.days * 86400 + value.seconds
+        return value
+
+    @staticmethod
+    def _decode_duration(value):
+        return timedelta(seconds=value) if type(value) is int else value
+
+    @property
+    def dial_start_at(self) -> Optional[datetime]:
+        if self._pending & _DIAL_START_AT:
+            self._dial_start_at = self._encode_timestamp(parse_iso_datetime(self._dial_start_at))
+            self._pending &= ~_DIAL_START_AT
+        return self._decode_timestamp(self._dial_start_at)
+
+    @dial_start_at.setter
+    def dial_start_at(self, value) -> None:
+        self._pending &= ~_DIAL_START_AT
+        self._dial_start_at = self._encode_timestamp(value)
+
+    @property
+    def dial_answered_at(self) -> Optional[datetime]:
+        if self._pending & _DIAL_ANSWERED_AT:
+            self._dial_answered_at = self._encode_timestamp(_parse_answered_at(self._dial_answered_at))
+            self._pending &= ~_DIAL_ANSWERED_AT
+        return self._decode_timestamp(self._dial_answered_at)
+
+    @dial_answered_at.setter
+    def dial_answered_at(self, value) -> None:
+        self._pending &= ~_DIAL_ANSWERED_AT
+        self._dial_answered_at = self._encode_timestamp(value)
+
+    @property
+    def dial_end_at(self) -> Optional[datetime]:
+        if self._pending & _DIAL_END_AT:
+            self._dial_end_at = self._encode_timestamp(parse_iso_datetime(self._dial_end_at))
+            self._pending &= ~_DIAL_END_AT
+        return self._decode_timestamp(self._dial_end_at)
+
+    @dial_end_at.setter
+    def dial_end_at(self, value) -> None:
+        self._pending &= ~_DIAL_END_AT
+        self._dial_end_at = self._encode_timestamp(value)
+
+    @property
+    def ringing_time(self) -> Optional[timedelta]:
+        if self._pending & _RINGING_TIME:
+            self._ringing_time = self._encode_duration(parse_time_duration(self._ringing_time))
+            self._pending &= ~_RINGING_TIME
+        return self._decode_duration(self._ringing_time)
+
+    @ringing_time.setter
+    def ringing_time(self, value) -> None:
+        self._pending &= ~_RINGING_TIME
+        self._ringing_time = self._encode_duration(value)
+
+    @property
+    def call_duration(self) -> Optional[timedelta]:
+        if self._pending & _CALL_DURATION:
+            self._call_duration = self._encode_duration(parse_time_duration(self._call_duration))
+            self._pending &= ~_CALL_DURATION
+        return self._decode_duration(self._call_duration)
+
+    @call_duration.setter
+    def call_duration(self, value) -> None:
+        self._pending &= ~_CALL_DURATION
+        self._call_duration = self._encode_duration(value)
+
+    @property
+    def call_memo(self) -> str:
+        if self._pending & _CALL_MEMO:
+            self.call_memo = parse_call_memo(self._call_memo)
+        return self._call_memo
+
+    @call_memo.setter
+    def call_memo(self, value) -> None:
+        self._pending &= ~_CALL_MEMO
+        self._call_memo = _intern(value)
+
+    @property
+    def number_type(self) -> str:
+        if self._pending & _NUMBER_TYPE:
+            self.number_type = classify_number(self.call_to, self.call_type, self.call_from, self.call_to)
+        return self._number_type
+
+    @number_type.setter
+    def number_type(self, value) -> None:
+        self._pending &= ~_NUMBER_TYPE
+        self._number_type = _intern(value)
+
+    @property
+    def call_charge(self) -> str:
+        if self._pending & _CALL_CHARGE:
+            self.call_charge = self.calculate_call_charge()
+        return self._call_charge
+
+    @call_charge.setter
+    def call_charge(self, value) -> None:
+        self._pending &= ~_CALL_CHARGE
+        self._call_charge = _intern(value)
+
+    def set_call_type(self, call_type: str) -> None:
+        """Changes the call type. The number depends on it, so it is classified
+        again when next read."""
+        self.call_type = _intern(call_type)
+        self._pending |= _NUMBER_TYPE
 
     def calculate_per_minute_charge(self, rate: float) -> str:
         minutes = math.ceil(self.call_duration.total_seconds() / 60)
@@ -50,134 +305,22 @@ class CallDetail:
 
     @property
     def matched_client(self):
-        if not hasattr(self, "_matched_client"):
-            self._matched_client = next(
-                (config_entry for config_entry in CONFIG if config_entry.client == self.client),
-                None
-            )
-        return self._matched_client
+        return self.client_entry.files if self.client_entry is not None else None
 
     @property
     def is_enduser(self):
-        return self.matched_client is not None and "enduser" in self.matched_client.client.lower()
-
-    def _handle_number_charge(self, number, allowed_types, rate, rate_type, call_type, call_to, call_from):
-        if call_type in allowed_types and (call_to == number or call_from == number):
-            if rate == 0:
-                rate = 720
-            if rate_type == "per_minute":
-                return self.calculate_per_minute_charge(rate)
-            elif rate_type == "per_second":
-                return self.calculate_per_second_charge(rate)
-        return None
+        return self.client_entry is not None and self.client_entry.is_enduser
 
     def calculate_call_charge(self) -> str:
-        SPECIAL_ZERO_CHARGE_CALLERS = {"2150913403", "85161662298", "85157455618", "82248400487", "2150913400", "2131141271"}
-        config = self.matched_client
-
-        call_to = str(self.call_to or "").strip()
-        call_from = str(self.call_from or "").strip()
-        call_type = (self.call_type or "").strip().lower()
-        number_type = self.number_type.lower() if self.number_type else ""
-        chargeable_types = [ct.lower() for ct in config.chargeable_call_types] if config.chargeable_call_types else ["outbound call", "predictive dialer"]
-
-        if not config:
+        if self.client_entry is None:
             return self.calculate_per_minute_charge(720)
 
-        if call_from in SPECIAL_ZERO_CHARGE_CALLERS and self.matched_client and self.matched_client.client == "siemens-id":
+        rate, rate_type = self.client_entry.tariff_plan.resolve(self.call_to, self.call_from, self.call_type, self.number_type)
+        if rate_type == "free":
             return "0"
-
-        #Excluded number type
-        if number_type == "internal call":
-            return self.calculate_per_minute_charge(0)
-
-        # Premium call handling
-        if number_type in ["premium call", "toll-free", "split charge"] or number_type in EMERGENCY_NUMBERS.values():
-            rate = 1700 + (200 if self.is_enduser else 0)
-            return self.calculate_per_minute_charge(rate)
-
-        # International call handling
-        carrier_key = config.carrier.title()  # Normalize the carrier name
-        rate_map = INTERNATIONAL_RATES.get(carrier_key, INTERNATIONAL_RATES["Atlasat"])
-
-        matched_key = next(
-            (k for k in rate_map if k.lower() in number_type.lower() or number_type.lower() in k.lower()),
-            None
-        )
-
-        if matched_key:
-            base_rate = rate_map[matched_key]
-            if self.is_enduser:
-                base_rate += 200
-            return self.calculate_per_minute_charge(base_rate)
-
-        # Specific number logic for S2C
-        s2c_target = call_to or call_from  # fallback if call_to is empty
-        #print(f"DEBUG: call_type={call_type}, number_type={number_type}, call_to={call_to}, call_from={call_from}, s2c_target={s2c_target}, config.s2c={config.s2c}")
-        s2c_list = config.s2c if isinstance(config.s2c, list) else [config.s2c]
-        if (s2c_target in s2c_list or number_type == "scancall"):
-            #print(f"DEBUG: Matched S2C by number or type")
-
-            if call_type in ["incoming call", "answering machine"]:
-                if config.s2c_rate_type == "per_minute":
-                    return self.calculate_per_minute_charge(config.s2c_rate)
-                elif config.s2c_rate_type == "per_second":
-                    return self.calculate_per_second_charge(config.s2c_rate)
-
-            elif call_type in chargeable_types:
-                if config.s2c_rate_type == "per_minute":
-                    return self.calculate_per_minute_charge(config.s2c_rate)
-                elif config.s2c_rate_type == "per_second":
-                    return self.calculate_per_second_charge(config.s2c_rate)
-
-        number1_cts = [ct.lower() for ct in (config.number1_chargeable_call_types or [])]
-        result = self._handle_number_charge(
-            config.number1,
-            number1_cts,
-            config.number1_rate or 0,
-            config.number1_rate_type or "per_minute",
-            call_type,
-            call_to,
-            call_from
-        )
-        if result:
-            return result
-
-        number2_cts = [ct.lower() for ct in (config.number2_chargeable_call_types or [])]
-        result = self._handle_number_charge(
-            config.number2,
-            number2_cts,
-            config.number2_rate or 0,
-            config.number2_rate_type or "per_minute",
-            call_type,
-            call_to,
-            call_from
-        )
-        if result:
-            return result
-
-        # Otherwise, fallback to general chargeable_call_types (for all other calls)
-        allowed_types = [ct.lower() for ct in getattr(config, "chargeable_call_types", [])]
-        if not allowed_types or call_type in allowed_types:
-            rate_type = getattr(config, "rate_type", "per_minute")
-            rate = getattr(config, "rate", 0)
-            if rate_type == "per_minute":
-                return self.calculate_per_minute_charge(rate)
-            elif rate_type == "per_second":
-                return self.calculate_per_second_charge(rate)
-
-        # General chargeable logic
-        if call_type in chargeable_types:
-            if config.rate_type == "per_second":
-                return self.calculate_per_second_charge(config.rate if config.rate is not None else 720)
-            else:
-                return self.calculate_per_minute_charge(config.rate if config.rate is not None else 720)
-
-        # Excluded call types
-        if call_type not in chargeable_types:
-            return self.calculate_per_minute_charge(0)
-
-        return self.calculate_per_minute_charge(720)
+        if rate_type == "per_second":
+            return self.calculate_per_second_charge(rate)
+        return self.calculate_per_minute_charge(rate)
 
     def to_dict(self) -> dict:
         return {
@@ -186,7 +329,7 @@ class CallDetail:
             "Call from": self.call_from,
             "Call to": self.call_to,
             "Call type": self.call_type,
-            "Number type": classify_number(self.call_to, self.call_type, self.call_from, self.call_to),
+            "Number type": self.number_type,
             "Dial starts at": format_datetime_as_human_readable(self.dial_start_at),
             "Dial answered at": format_datetime_as_human_readable(
                 self.dial_answered_at
@@ -198,5 +341,29 @@ class CallDetail:
             "Call charge": self.call_charge,
         }
 
-    def hash_key(self) -> str:
-        return call_hash(self.call_from, self.call_to, self.dial_start_at)
\ No newline at end of file
+    def encoded(self, name: str) -> Optional[tuple[int, ...]]:
+        """A timestamp or duration field as CallBatch.encoded gives it, (epoch,
+        offset) or (seconds,), read from the compact storage without building a
+        datetime or timedelta. None when the field holds a value that does not
+        fit, like a timestamp in a second timezone, or when the timezone has no
+        fixed offset."""
+        if self._pending & _TYPED_FIELDS[name]:
+            getattr(self, name)
+        value = getattr(self, f"_{name}")
+        if name in ("ringing_time", "call_duration"):
+            return (NAT,) if value is None else (value,) if type(value) is int else None
+        if value is None:
+            return NAT, 0
+        if type(value) is not int:
+            return None
+        if self._timezone is None:
+            return value, NAIVE
+        offset = self._timezone.utcoffset(None)
+        return (value, offset // _SECOND) if offset is not None else None
+
+    def hash_key(self) -> int:
+        """The call's key, before collisions are resolved."""
+        return call_key(self.call_from, self.call_to, self.dial_start_at)
+
+    def identity(self) -> tuple:
+        return call_identity(self.call_from, self.call_to, self.dial_start_at)
\ No newline at end of file
@@ -1,6 +1,9 @@
 from dataclasses import dataclass, field
+from functools import cached_property
 from typing import List, Optional
 
+from src.TariffPlan import TariffPlan
+
 @dataclass
 class Files:
     client: str
@@ -29,3 +32,8 @@ class Files:
     #General
     chargeable_call_types: List[str] = field(default_factory=list)
     #custom_logic: Optional[str] = None
+
+    @cached_property
+    def tariff_plan(self) -> TariffPlan:
+        """Charging rules of this client, compiled on first use."""
+        return TariffPlan.from_files(self)
@@ -0,0 +1,163 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.idn_area_codes import EMERGENCY_NUMBERS
+from src.international_rates import INTERNATIONAL_RATES, international_rate_index, lookup_international_rate
+
+# Callers that are never charged for siemens-id
+SPECIAL_ZERO_CHARGE_CALLERS = frozenset({"2150913403", "85161662298", "85157455618", "82248400487", "2150913400", "2131141271"})
+
+DEFAULT_CHARGEABLE_CALL_TYPES = ("outbound call", "predictive dialer")
+PREMIUM_NUMBER_TYPES = frozenset(["premium call", "toll-free", "split charge", *EMERGENCY_NUMBERS.values()])
+S2C_INCOMING_CALL_TYPES = frozenset(["incoming call", "answering machine"])
+RATE_TYPES = ("per_minute", "per_second")
+
+# A decision is the (rate, rate_type) a call is charged with. "free" calls are
+# charged a flat "0" without looking at their duration.
+Decision = tuple[Optional[float], str]
+FREE: Decision = (0, "free")
+NOT_CHARGED: Decision = (0, "per_minute")
+
+
+def _decision(rate: Optional[float], rate_type: Optional[str]) -> Optional[Decision]:
+    return (rate, rate_type) if rate_type in RATE_TYPES else None
+
+
+def _lowered(call_types: Optional[list[str]]) -> frozenset[str]:
+    return frozenset(call_type.lower() for call_type in call_types or [])
+
+
+@dataclass(frozen=True)
+class NumberRule:
+    """Special rate for calls to or from one of the client's own numbers."""
+
+    number: Optional[str]
+    call_types: frozenset[str]
+    decision: Optional[Decision]
+
+    @classmethod
+    def from_config(cls, number, call_types, rate, rate_type) -> "NumberRule":
+        rate = rate or 0
+        if rate == 0:
+            rate = 720
+        return cls(number, _lowered(call_types), _decision(rate, rate_type or "per_minute"))
+
+
+@dataclass(frozen=True)
+class TariffPlan:
+    """Charging rules of one Files entry, compiled once.
+
+    resolve() applies the rules in the same order calculate_call_charge always
+    has: zero-charge callers, internal calls, premium numbers, international
+    rates, S2C numbers, number1/number2, the general chargeable call types and
+    finally no charge. The rules that only depend on the number type or on the
+    call type are memoized per distinct value.
+    """
+
+    client: str
+    is_enduser: bool
+    zero_charge_callers: frozenset[str]
+    international_rates: dict[str, float]
+    international_rate_index: dict[str, Optional[float]]
+    s2c_numbers: frozenset
+    s2c_call_types: frozenset[str]
+    s2c_decision: Optional[Decision]
+    number_rules: tuple[NumberRule, ...]
+    general_call_types: frozenset[str]
+    general_decision: Optional[Decision]
+    chargeable_call_types: frozenset[str]
+    chargeable_decision: Decision
+    _by_number_type: dict = field(default_factory=dict, compare=False, repr=False)
+    _by_call_type: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @classmethod
+    def from_files(cls, files) -> "TariffPlan":
+        chargeable_call_types = _lowered(files.chargeable_call_types) or frozenset(DEFAULT_CHARGEABLE_CALL_TYPES)
+        s2c_numbers = files.s2c if isinstance(files.s2c, list) else [files.s2c]
+        rate = files.rate if files.rate is not None else 720
+        return cls(
+            client=files.client,
+            is_enduser="enduser" in files.client.lower(),
+            zero_charge_callers=SPECIAL_ZERO_CHARGE_CALLERS if files.client == "siemens-id" else frozenset(),
+            international_rates=INTERNATIONAL_RATES.get(files.carrier.title(), INTERNATIONAL_RATES["Atlasat"]),
+            international_rate_index=international_rate_index(files.carrier),
+            s2c_numbers=frozenset(s2c_numbers),
+            s2c_call_types=S2C_INCOMING_CALL_TYPES | chargeable_call_types,
+            s2c_decision=_decision(files.s2c_rate, files.s2c_rate_type),
+            number_rules=(
+                NumberRule.from_config(
+                    files.number1, files.number1_chargeable_call_types, files.number1_rate, files.number1_rate_type
+                ),
+                NumberRule.from_config(
+                    files.number2, files.number2_chargeable_call_types, files.number2_rate, files.number2_rate_type
+                ),
+            ),
+            general_call_types=_lowered(getattr(files, "chargeable_call_types", [])),
+            general_decision=_decision(getattr(files, "rate", 0), getattr(files, "rate_type", "per_minute")),
+            chargeable_call_types=chargeable_call_types,
+            chargeable_decision=(rate, "per_second" if files.rate_type == "per_second" else "per_minute"),
+        )
+
+    def resolve(self, call_to, call_from, call_type: Optional[str], number_type: Optional[str]) -> Decision:
+        call_to = str(call_to or "").strip()
+        call_from = str(call_from or "").strip()
+        call_type = (call_type or "").strip().lower()
+        number_type = number_type.lower() if number_type else ""
+
+        if call_from in self.zero_charge_callers:
+            return FREE
+
+        decision = self.number_type_decision(number_type)
+        if decision is not None:
+            return decision
+
+        # Specific number logic for S2C, falling back to call_from if call_to is empty
+        s2c_target = call_to or call_from
+        if (s2c_target in self.s2c_numbers or number_type == "scancall") and call_type in self.s2c_call_types:
+            if self.s2c_decision is not None:
+                return self.s2c_decision
+
+        for rule in self.number_rules:
+            if rule.decision is not None and call_type in rule.call_types and rule.number in (call_to, call_from):
+                return rule.decision
+
+        return self.call_type_decision(call_type)
+
+    def number_type_decision(self, number_type: str) -> Optional[Decision]:
+        """Decision of the internal, premium and international rules for a
+        lowercased number type, or None when none of them applies."""
+        if number_type not in self._by_number_type:
+            self._by_number_type[number_type] = self._resolve_number_type(number_type)
+        return self._by_number_type[number_type]
+
+    def call_type_decision(self, call_type: str) -> Decision:
+        """Decision of the general chargeable call type rules for a lowercased call type."""
+        if call_type not in self._by_call_type:
+            self._by_call_type[call_type] = self._resolve_call_type(call_type)
+        return self._by_call_type[call_type]
+
+    def _resolve_number_type(self, number_type: str) -> Optional[Decision]:
+        # Excluded number type
+        if number_type == "internal call":
+            return NOT_CHARGED
+
+        if number_type in PREMIUM_NUMBER_TYPES:
+            return (1700 + (200 if self.is_enduser else 0), "per_minute")
+
+        base_rate = lookup_international_rate(self.international_rate_index, self.international_rates, number_type)
+        if base_rate is not None:
+            if self.is_enduser:
+                base_rate += 200
+            return (base_rate, "per_minute")
+        return None
+
+    def _resolve_call_type(self, call_type: str) -> Decision:
+        # General chargeable_call_types, for all other calls
+        if self.general_decision is not None and (not self.general_call_types or call_type in self.general_call_types):
+            return self.general_decision
+
+        if call_type in self.chargeable_call_types:
+            return self.chargeable_decision
+
+        # Excluded call types
+        return NOT_CHARGED
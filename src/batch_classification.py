@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.utils import classify_number
+
+
+@dataclass
+class ClassifiedBatch:
+    """Number types for a batch of calls, classified once per distinct
+    (call_to, call_type, call_from) combination."""
+
+    number_type: pd.Series
+    # Position of every row's combination in first_rows
+    codes: np.ndarray
+    # Row position of the first call with each combination
+    first_rows: np.ndarray
+
+    @property
+    def rows(self) -> int:
+        return len(self.codes)
+
+    @property
+    def unique(self) -> int:
+        return len(self.first_rows)
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of rows answered from a combination that was already classified."""
+        return 1 - self.unique / self.rows if self.rows else 0.0
+
+
+def factorize_columns(*columns: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Codes for the distinct value combinations of the columns, numbered in
+    order of first appearance, plus the row position of each first appearance."""
+    combined = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        # Each column is factorized on its own, so ints and strings never get compared
+        column_codes, column_uniques = pd.factorize(column, use_na_sentinel=False)
+        combined = combined * max(len(column_uniques), 1) + column_codes
+        # Renumber after every column so the mixed radix never overflows int64
+        combined, _ = pd.factorize(combined)
+    codes = combined.astype(np.int64)
+    _, first_rows = np.unique(codes, return_index=True)
+    return codes, first_rows
+
+
+def classify_batch(call_to: pd.Series, call_type: pd.Series, call_from: pd.Series) -> ClassifiedBatch:
+    """Classifies every distinct number combination once and broadcasts the
+    result back to all rows."""
+    codes, first_rows = factorize_columns(call_to, call_type, call_from)
+    unique_types = np.empty(len(first_rows), dtype=object)
+    unique_types[:] = [
+        classify_number(to, type_, from_, to)
+        for to, type_, from_ in zip(
+            call_to.iloc[first_rows], call_type.iloc[first_rows], call_from.iloc[first_rows]
+        )
+    ]
+    number_type = pd.Series(unique_types[codes], index=call_to.index, dtype=object)
+    return ClassifiedBatch(number_type=number_type, codes=codes, first_rows=first_rows)
@@ -0,0 +1,210 @@
+from datetime import timedelta, timezone
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.client_registry import ClientEntry
+from src.utils import NAIVE, NAT, encode_timestamp_column
+
+OBJECT_COLUMNS = (
+    "client",
+    "carrier",
+    "sequence_id",
+    "user_name",
+    "call_from",
+    "call_to",
+    "call_type",
+    "number_type",
+    "call_memo",
+    "call_charge",
+)
+TIMESTAMP_COLUMNS = ("dial_start_at", "dial_answered_at", "dial_end_at")
+DURATION_COLUMNS = ("ringing_time", "call_duration")
+
+
+def _offset_column(name: str) -> str:
+    return f"{name}_offset"
+
+
+def encode_duration_column(durations: pd.Series) -> np.ndarray:
+    """Whole seconds of a timedelta64 column, NAT where missing."""
+    nanoseconds = durations.to_numpy().astype("timedelta64[ns]").view("int64")
+    missing = nanoseconds == NAT
+    if (nanoseconds[~missing] % 1_000_000_000).any():
+        raise ValueError("Call durations must be whole seconds")
+    return np.where(missing, NAT, nanoseconds // 1_000_000_000)
+
+
+def decode_timestamps(epochs: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Timestamps as datetime objects in their own UTC offset, None where missing."""
+    values = np.full(len(epochs), None, dtype=object)
+    present = epochs != NAT
+    shift = np.where(offsets == NAIVE, 0, offsets.astype(np.int64) * 1_000_000)
+    wall_clock = (epochs + np.where(present, shift, 0)).view("datetime64[us]").astype(object)
+    zones = {offset: timezone(timedelta(seconds=int(offset))) for offset in np.unique(offsets[present & (offsets != NAIVE)])}
+    zones[NAIVE] = None
+    for position in np.flatnonzero(present):
+        values[position] = wall_clock[position].replace(tzinfo=zones[offsets[position]])
+    return values
+
+
+def decode_durations(seconds: np.ndarray) -> np.ndarray:
+    """Durations as timedelta objects, None where missing."""
+    values = np.full(len(seconds), None, dtype=object)
+    present = seconds != NAT
+    values[present] = seconds[present].view("timedelta64[s]").astype(object)
+    return values
+
+
+class CallBatch:
+    """Calls stored column by column, as one NumPy array per field.
+
+    Call keys are int64, timestamps int64 epoch microseconds with an int32 UTC
+    offset column each, durations int64 seconds, everything else object
+    columns. Calls are looked up by call key through a hash index.
+
+    The number type and the charge stay None until charge_calls works them
+    out, with the ClientEntry the merge recorded for the call's client in
+    client_entries.
+
+    The columnar readers of process_dashboard_csv and process_console_csv
+    merge into a CallBatch, and save_merged_csv writes one.
+    """
+
+    def __init__(self):
+        self.columns: dict[str, np.ndarray] = {"key": np.empty(0, dtype=np.int64)}
+        for name in OBJECT_COLUMNS:
+            self.columns[name] = np.empty(0, dtype=object)
+        for name in TIMESTAMP_COLUMNS:
+            self.columns[name] = np.empty(0, dtype=np.int64)
+            self.columns[_offset_column(name)] = np.empty(0, dtype=np.int32)
+        for name in DURATION_COLUMNS:
+            self.columns[name] = np.empty(0, dtype=np.int64)
+        self.client_entries: dict[str, Optional[ClientEntry]] = {}
+        self._index: Optional[pd.Index] = None
+
+    def __len__(self) -> int:
+        return len(self.columns["key"])
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.index
+
+    @property
+    def index(self) -> pd.Index:
+        """Hash index of the call keys, which are unique within a batch."""
+        if self._index is None:
+            self._index = pd.Index(self.columns["key"], dtype=np.int64)
+        return self._index
+
+    def positions(self, keys) -> np.ndarray:
+        """Row of every key, -1 for keys that are not in the batch."""
+        return self.index.get_indexer(pd.Index(keys, dtype=np.int64))
+
+    def identities(self, positions: np.ndarray) -> pd.DataFrame:
+        """The call_identity_frame of the calls at positions."""
+        return pd.DataFrame({
+            "call_from": self.columns["call_from"][positions],
+            "call_to": self.columns["call_to"][positions],
+            "dial_start_epoch": self.columns["dial_start_at"][positions],
+            "dial_start_offset": self.columns[_offset_column("dial_start_at")][positions],
+        })
+
+    def stored_identities(self, keys: pd.Series) -> tuple[np.ndarray, pd.DataFrame]:
+        """The stored_identities lookup of resolve_call_keys."""
+        positions = self.positions(keys)
+        taken = positions != -1
+        return taken, self.identities(positions[taken])
+
+    def sequence_ids(self) -> set[str]:
+        return set(self.columns["sequence_id"])
+
+    def append(self, **values) -> np.ndarray:
+        """Adds one call per row of the given columns and returns their positions.
+
+        Timestamp columns take datetime columns and duration columns timedelta64
+        columns. Columns that are left out are filled with None, NAT for the
+        typed ones.
+        """
+        size = len(next(iter(values.values())))
+        start = len(self)
+        new_columns = {"key": np.zeros(size, dtype=np.int64)}
+        for name in OBJECT_COLUMNS:
+            new_columns[name] = np.full(size, None, dtype=object)
+        for name in TIMESTAMP_COLUMNS:
+            new_columns[name] = np.full(size, NAT, dtype=np.int64)
+            new_columns[_offset_column(name)] = np.zeros(size, dtype=np.int32)
+        for name in DURATION_COLUMNS:
+            new_columns[name] = np.full(size, NAT, dtype=np.int64)
+
+        for name, column in values.items():
+            column = column if isinstance(column, pd.Series) else pd.Series(column)
+            if name == "key":
+                new_columns[name] = column.to_numpy(dtype=np.int64)
+            elif name in TIMESTAMP_COLUMNS:
+                new_columns[name], new_columns[_offset_column(name)] = encode_timestamp_column(column)
+            elif name in DURATION_COLUMNS:
+                new_columns[name] = encode_duration_column(column)
+            elif name in OBJECT_COLUMNS:
+                new_columns[name] = column.to_numpy(dtype=object)
+            else:
+                raise KeyError(f"Unknown call field {name!r}")
+
+        for name, column in new_columns.items():
+            self.columns[name] = np.concatenate([self.columns[name], column])
+        self._index = None
+        return np.arange(start, start + size)
+
+    def set(self, name: str, positions: np.ndarray, values) -> None:
+        """Overwrites a field of the calls at positions.
+
+        Like in append, timestamp fields take a datetime column and duration
+        fields a timedelta64 column.
+        """
+        if name == "key":
+            raise KeyError("Call keys cannot be changed")
+        if name in OBJECT_COLUMNS:
+            self.columns[name][positions] = np.asarray(values, dtype=object)
+        elif name in TIMESTAMP_COLUMNS:
+            self.set_encoded(name, positions, *encode_timestamp_column(pd.Series(values)))
+        elif name in DURATION_COLUMNS:
+            self.set_encoded(name, positions, encode_duration_column(pd.Series(values)))
+        else:
+            raise KeyError(f"Unknown call field {name!r}")
+
+    def set_encoded(self, name: str, positions: np.ndarray, *encoded: np.ndarray) -> None:
+        """Overwrites a typed field of the calls at positions with values that are
+        already encoded: epochs and offsets for timestamps, seconds for durations."""
+        if name in TIMESTAMP_COLUMNS:
+            epochs, offsets = encoded
+            self.columns[name][positions] = epochs
+            self.columns[_offset_column(name)][positions] = offsets
+        elif name in DURATION_COLUMNS:
+            (seconds,) = encoded
+            self.columns[name][positions] = seconds
+        else:
+            raise KeyError(f"Unknown typed call field {name!r}")
+
+    def encoded(self, name: str) -> tuple[np.ndarray, ...]:
+        """A typed field as set_encoded takes it."""
+        if name in TIMESTAMP_COLUMNS:
+            return self.columns[name], self.columns[_offset_column(name)]
+        if name in DURATION_COLUMNS:
+            return (self.columns[name],)
+        raise KeyError(f"Unknown typed call field {name!r}")
+
+    def values(self, name: str) -> np.ndarray:
+        """A field as an object array of Python values."""
+        if name in TIMESTAMP_COLUMNS:
+            return decode_timestamps(self.columns[name], self.columns[_offset_column(name)])
+        if name in DURATION_COLUMNS:
+            return decode_durations(self.columns[name])
+        return self.columns[name].copy()
+
+    def select(self, positions) -> "CallBatch":
+        """A new batch with the calls at positions, a boolean mask or row numbers."""
+        positions = np.flatnonzero(positions) if np.asarray(positions).dtype == bool else np.asarray(positions)
+        selected = CallBatch()
+        selected.columns = {name: column[positions] for name, column in self.columns.items()}
+        selected.client_entries = dict(self.client_entries)
+        return selected
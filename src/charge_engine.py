@@ -0,0 +1,151 @@
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.FileConfig import Files
+from src.TariffPlan import FREE, Decision, TariffPlan
+
+PER_MINUTE_CODE, PER_SECOND_CODE, FREE_CODE = 0, 1, 2
+RATE_TYPE_CODES = {"per_minute": PER_MINUTE_CODE, "per_second": PER_SECOND_CODE, "free": FREE_CODE}
+
+
+def factorize_mapped(column: pd.Series, func: Callable) -> tuple[np.ndarray, np.ndarray]:
+    """Codes of a column plus a scalar function applied once per distinct value,
+    so that func(column[i]) == mapped[codes[i]]."""
+    values = column.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(values)
+    mapped = [func(value) for value in uniques]
+    # factorize folds None and NaN together, which the scalar rules tell apart,
+    # so every missing value gets a slot of its own
+    missing = np.flatnonzero(codes == -1)
+    codes[missing] = np.arange(len(uniques), len(uniques) + len(missing))
+    mapped.extend(func(value) for value in values[missing])
+    mapped_array = np.empty(len(mapped), dtype=object)
+    mapped_array[:] = mapped
+    return codes, mapped_array
+
+
+def isin(values: np.ndarray, candidates) -> np.ndarray:
+    """Hash-based membership test that works on mixed int/str/None values."""
+    return pd.Index(values, dtype=object).isin(list(candidates))
+
+
+class _Decisions:
+    """Per-row (rate, rate_type) arrays, filled rule by rule. A row keeps the
+    first decision that applies to it."""
+
+    def __init__(self, size: int):
+        self.decided = np.zeros(size, dtype=bool)
+        self.rate = np.zeros(size, dtype=np.float64)
+        self.rate_is_int = np.zeros(size, dtype=bool)
+        self.rate_type = np.zeros(size, dtype=np.int8)
+
+    def assign(self, mask: np.ndarray, decision: Optional[Decision]) -> None:
+        if decision is not None:
+            self.assign_table(np.zeros(len(mask), dtype=np.int64), [decision], mask)
+
+    def assign_table(
+        self, codes: np.ndarray, table: list[Optional[Decision]], mask: Optional[np.ndarray] = None
+    ) -> None:
+        """Assigns table[code] to every row, skipping None entries."""
+        applies = np.array([decision is not None for decision in table] + [False])
+        mask = applies[codes] & ~self.decided if mask is None else mask & applies[codes] & ~self.decided
+        if not mask.any():
+            return
+        table = [decision or (0, "per_minute") for decision in table]
+        if any(table[code][0] is None for code in np.unique(codes[mask])):
+            raise TypeError("No rate configured for some of the calls")
+        rows = codes[mask]
+        self.rate[mask] = np.array([np.nan if rate is None else float(rate) for rate, _ in table])[rows]
+        self.rate_is_int[mask] = np.array([isinstance(rate, int) for rate, _ in table])[rows]
+        self.rate_type[mask] = np.array([RATE_TYPE_CODES[rate_type] for _, rate_type in table], dtype=np.int8)[rows]
+        self.decided |= mask
+
+    def assign_lookup(self, codes: np.ndarray, keys: np.ndarray, lookup: Callable[[str], Optional[Decision]]) -> None:
+        """Assigns the decision lookup(keys[code]) to every row."""
+        self.assign_table(codes, [lookup(key) for key in keys])
+
+
+def _normalized_number(number) -> str:
+    return str(number or "").strip()
+
+
+def _normalized_call_type(call_type) -> str:
+    return (call_type or "").strip().lower()
+
+
+def _normalized_number_type(number_type) -> str:
+    return number_type.lower() if number_type else ""
+
+
+def _format_charges(values: np.ndarray, is_int: np.ndarray) -> np.ndarray:
+    """Formats charges like str() formats the Python int or float the scalar path
+    computes. A month only has a handful of distinct charges, so each is formatted once."""
+    formatted = np.empty(len(values), dtype=object)
+    for selection, convert in ((is_int, int), (~is_int, float)):
+        codes, uniques = pd.factorize(values[selection])
+        formatted[selection] = np.array([str(convert(value)) for value in uniques], dtype=object)[codes]
+    return formatted
+
+
+def resolve_batch(df: pd.DataFrame, plan: TariffPlan) -> _Decisions:
+    """Applies the rules of a tariff plan to every row, in TariffPlan.resolve order.
+
+    Every column is factorized first. The membership tests run on the distinct
+    values, the rows only gather the results through their codes.
+    """
+    to_codes, call_to = factorize_mapped(df["call_to"], _normalized_number)
+    from_codes, call_from = factorize_mapped(df["call_from"], _normalized_number)
+    type_codes, call_type = factorize_mapped(df["call_type"], _normalized_call_type)
+    number_type_codes, number_type = factorize_mapped(df["number_type"], _normalized_number_type)
+
+    decisions = _Decisions(len(df))
+    decisions.assign(isin(call_from, plan.zero_charge_callers)[from_codes], FREE)
+    decisions.assign_lookup(number_type_codes, number_type, plan.number_type_decision)
+
+    # S2C targets call_to, or call_from when call_to is empty
+    s2c_target = np.where(
+        (call_to != "")[to_codes],
+        isin(call_to, plan.s2c_numbers)[to_codes],
+        isin(call_from, plan.s2c_numbers)[from_codes],
+    )
+    is_s2c = s2c_target | (number_type == "scancall")[number_type_codes]
+    decisions.assign(is_s2c & isin(call_type, plan.s2c_call_types)[type_codes], plan.s2c_decision)
+
+    for rule in plan.number_rules:
+        own_number = isin(call_to, [rule.number])[to_codes] | isin(call_from, [rule.number])[from_codes]
+        decisions.assign(own_number & isin(call_type, rule.call_types)[type_codes], rule.decision)
+
+    decisions.assign_lookup(type_codes, call_type, plan.call_type_decision)
+    return decisions
+
+
+def charge_batch(df: pd.DataFrame, files: Optional[Files]) -> pd.Series:
+    """Charges a whole batch of calls at once.
+
+    df needs the call_to, call_from, call_type, number_type and call_duration
+    (timedelta64) columns. The result is the same string CallDetail.calculate_call_charge
+    gives for every row: per-minute rates are rounded up to whole minutes,
+    per-second rates are charged on the exact duration.
+    """
+    seconds = df["call_duration"].dt.total_seconds().to_numpy()
+    if files is None:
+        decisions = _Decisions(len(df))
+        decisions.assign(np.ones(len(df), dtype=bool), (720, "per_minute"))
+    else:
+        decisions = resolve_batch(df, files.tariff_plan)
+
+    per_minute = decisions.rate_type == PER_MINUTE_CODE
+    per_second = decisions.rate_type == PER_SECOND_CODE
+    minutes = np.ceil(seconds / 60)
+    charges = np.zeros(len(df), dtype=np.float64)
+    charges[per_minute] = minutes[per_minute] * decisions.rate[per_minute]
+    charges[per_second] = seconds[per_second] * decisions.rate[per_second]
+    # Whole minutes times an int rate stay ints, anything involving a float rate
+    # or a per-second duration is a float
+    is_int = decisions.rate_is_int & per_minute
+
+    formatted = _format_charges(charges, is_int)
+    formatted[decisions.rate_type == FREE_CODE] = "0"
+    return pd.Series(formatted, index=df.index, dtype=object)
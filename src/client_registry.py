@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from config import CONFIG
+from src.FileConfig import Files
+from src.TariffPlan import TariffPlan
+
+
+@dataclass(frozen=True)
+class ClientEntry:
+    """A configured client with the flags the merge needs, resolved once."""
+
+    files: Files
+    tariff_plan: TariffPlan
+    is_enduser: bool
+
+    @classmethod
+    def from_files(cls, files: Files) -> "ClientEntry":
+        return cls(
+            files=files,
+            tariff_plan=files.tariff_plan,
+            is_enduser="enduser" in files.client.lower(),
+        )
+
+    @property
+    def client(self) -> str:
+        return self.files.client
+
+
+class ClientRegistry:
+    """Configured clients keyed by client name. The first entry wins if a name
+    is configured twice, like the old linear scan over CONFIG."""
+
+    def __init__(self, config: list[Files]):
+        self._entries: dict[str, ClientEntry] = {}
+        for files in config:
+            if files.client not in self._entries:
+                self._entries[files.client] = ClientEntry.from_files(files)
+
+    def get(self, client: str) -> Optional[ClientEntry]:
+        return self._entries.get(client)
+
+    def __getitem__(self, client: str) -> ClientEntry:
+        return self._entries[client]
+
+    def __contains__(self, client: str) -> bool:
+        return client in self._entries
+
+    def __iter__(self) -> Iterator[ClientEntry]:
+        return iter(self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+CLIENT_REGISTRY = ClientRegistry(CONFIG)
@@ -0,0 +1,195 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import timedelta
+from multiprocessing import get_context
+from typing import Optional
+
+from src.call_batch import CallBatch
+from src.csv_processing import (
+    process_console_csv,
+    process_dashboard_csv,
+    save_merged_csv,
+)
+from src.FileConfig import Files
+from src.parsed_cache import ParsedInputCache
+from src.run_manifest import build_manifest, code_fingerprint, is_up_to_date, rate_table_fingerprints, write_manifest
+from src.streaming_merge import stream_merge
+
+# Cost model of a merge, fitted on the April 2025 exports: a fixed overhead per
+# client plus a cost per dashboard and console row. Byte size was fitted too but
+# added nothing once rows were known, the wide dashboard rows hide it.
+FIXED_SECONDS = 0.07
+SECONDS_PER_ROW = 0.00006
+
+
+@dataclass(frozen=True)
+class ClientCost:
+    """Input size of one client and the merge time predicted from it."""
+
+    client: str
+    bytes: int
+    rows: int
+
+    @property
+    def predicted_seconds(self) -> float:
+        return FIXED_SECONDS + SECONDS_PER_ROW * self.rows
+
+
+def count_rows(path: str) -> int:
+    """Number of lines of a file, 0 if it does not exist."""
+    try:
+        with open(path, "rb") as file:
+            return sum(block.count(b"\n") for block in iter(lambda: file.read(1 << 20), b""))
+    except OSError:
+        return 0
+
+
+def file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def estimate_cost(files: Files) -> ClientCost:
+    paths = (files.dashboard, files.console)
+    return ClientCost(files.client, sum(map(file_size, paths)), sum(map(count_rows, paths)))
+
+
+@dataclass
+class ClientResult:
+    """Outcome of merging the files of one client."""
+
+    client: str
+    ok: bool
+    seconds: float
+    error: Optional[str] = None
+    predicted_seconds: Optional[float] = None
+    # The output was up to date with its manifest and was not rebuilt
+    skipped: bool = False
+
+
+def merge_client(
+    files: Files,
+    manifest: Optional[dict] = None,
+    cache_dir: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    match_tolerance: Optional[timedelta] = None,
+) -> ClientResult:
+    """Merges the dashboard and console files of one client into its output file,
+    then writes the manifest of the inputs it was built from next to it.
+    Parsed inputs are cached in cache_dir when it is set. With a chunksize the
+    files are merged by stream_merge instead, with bounded memory and no cache.
+    A match_tolerance turns on the time-tolerant join of the console rows.
+
+    Errors are caught and returned, so one broken client never stops the others.
+    """
+    start = time.perf_counter()
+    try:
+        print(f"> Merging files for client {files.client}")
+        if chunksize is not None:
+            stream_merge(
+                files.dashboard,
+                files.console,
+                files.carrier,
+                files.output,
+                files.client,
+                chunksize=chunksize,
+                match_tolerance=match_tolerance,
+            )
+        else:
+            code = manifest["code"] if manifest is not None else None
+            cache = ParsedInputCache(cache_dir, code) if cache_dir is not None else None
+            call_details = process_dashboard_csv(
+                files.dashboard, files.carrier, CallBatch(), client=files.client, cache=cache
+            )
+            call_details = process_console_csv(
+                files.console,
+                files.carrier,
+                call_details,
+                client=files.client,
+                cache=cache,
+                match_tolerance=match_tolerance,
+            )
+            save_merged_csv(call_details, files.output)
+        if manifest is not None:
+            write_manifest(files.output, manifest)
+    except Exception as e:
+        print(f"! Merging files for client {files.client} failed: {e}")
+        return ClientResult(files.client, False, time.perf_counter() - start, traceback.format_exc())
+    return ClientResult(files.client, True, time.perf_counter() - start)
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def run_clients(
+    config: list[Files],
+    workers: Optional[int] = None,
+    force: bool = False,
+    cache_dir: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    match_tolerance: Optional[timedelta] = None,
+) -> list[ClientResult]:
+    """Merges every client of config and returns the results in config order.
+
+    Clients whose output manifest matches their current inputs, config, rate
+    tables, code, match_tolerance and streaming mode are skipped, unless force
+    is set. A chunksize turns on the streaming merge.
+
+    With more than one worker the clients are spread over a process pool,
+    largest predicted cost first. Idle workers take the next client in that
+    order, so the small clients fill the gaps at the end instead of a big one
+    running alone. The pool always uses the spawn start method, so it behaves
+    the same on every platform; callers must only start it from under an
+    `if __name__ == "__main__":` guard.
+    """
+    rate_tables, code = rate_table_fingerprints(), code_fingerprint()
+    manifests = [build_manifest(files, rate_tables, code, match_tolerance, chunksize is not None) for files in config]
+    costs = [estimate_cost(files) for files in config]
+    results: list[Optional[ClientResult]] = [None] * len(config)
+    stale = []
+    for position, files in enumerate(config):
+        if not force and is_up_to_date(files, manifests[position]):
+            results[position] = ClientResult(files.client, True, 0.0, skipped=True)
+        else:
+            stale.append(position)
+
+    workers = min(workers or default_workers(), len(stale)) or 1
+    if workers == 1:
+        for position in stale:
+            results[position] = merge_client(
+                config[position], manifests[position], cache_dir, chunksize, match_tolerance
+            )
+    else:
+        order = sorted(stale, key=lambda position: costs[position].predicted_seconds, reverse=True)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            futures = {
+                pool.submit(
+                    merge_client, config[position], manifests[position], cache_dir, chunksize, match_tolerance
+                ): position
+                for position in order
+            }
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    results[position] = future.result()
+                except Exception as e:
+                    # The worker itself died, e.g. it ran out of memory
+                    results[position] = ClientResult(config[position].client, False, 0.0, repr(e))
+
+    for result, cost in zip(results, costs):
+        result.predicted_seconds = cost.predicted_seconds
+    return results
+
+
+def print_run_report(results: list[ClientResult]) -> None:
+    """Predicted and actual merge time of every client, slowest first."""
+    print(f"{'Client':<32}{'Predicted':>10}{'Actual':>10}  Status")
+    for result in sorted(results, key=lambda result: result.seconds, reverse=True):
+        status = "skipped" if result.skipped else "ok" if result.ok else "failed"
+        print(f"{result.client:<32}{result.predicted_seconds:>9.2f}s{result.seconds:>9.2f}s  {status}")
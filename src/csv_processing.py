@@ -1,23 +1,166 @@
-from typing import Optional
+from datetime import timedelta
+from typing import Iterator, Optional
 
+import numpy as np
 import pandas as pd
 
+from src.batch_classification import ClassifiedBatch, classify_batch
+from src.call_batch import DURATION_COLUMNS, CallBatch
 from src.CallDetail import CallDetail
-from src.utils import parse_jakarta_datetime, convert_to_jakarta_time_iso, parse_phone_number, call_hash
+from src.client_registry import CLIENT_REGISTRY, ClientEntry
+from src.charge_engine import charge_batch
+from src.parsed_cache import ParsedInputCache
+from src.tolerant_join import ConsoleMatches, match_within_tolerance
+from src.utils import (
+    NAT,
+    call_identity,
+    call_identity_frame,
+    call_key,
+    convert_to_region_time_column,
+    format_datetime_as_human_readable,
+    format_seconds_as_timedelta,
+    format_timedelta,
+    format_timestamp_codes_as_human_readable,
+    format_username,
+    parse_call_memo_column,
+    parse_iso_datetime_column,
+    parse_region_datetime,
+    parse_region_time,
+    parse_phone_number,
+    parse_phone_number_column,
+    encode_timestamp_column,
+    parse_time_duration,
+    parse_time_duration_column,
+    probe_call_key,
+    resolve_call_keys,
+)
+import itertools
 import math
 
 
+# Dashboard export columns used by the merge. The speech analytics columns
+# (frequencies, speech rates, keywords, ...) are never loaded.
+DASHBOARD_SCHEMA = {
+    "Sequence ID": str,
+    "User name": str,
+    "Call from": str,
+    "Call to": str,
+    "Call type": "category",
+    "Dial begin time": str,
+    "Call begin time": str,
+    "Call end time": str,
+    "Ringing time": str,
+    "Call duration": str,
+    "Call memo": str,
+}
+# Placeholders the dashboard writes instead of leaving a cell empty
+DASHBOARD_NULL_PLACEHOLDERS = {"Call begin time": ["-"]}
+# Dashboard text columns whose blank cells the merge reads as "nan"
+DASHBOARD_TEXT_COLUMNS = ("Sequence ID", "User name", "Call from", "Call to", "Call type", "Call memo")
+
+# Console export columns used by the merge. Everything else, notably the
+# unit_price_indonesia JSON repeated on every row, is never loaded.
+CONSOLE_SCHEMA = {
+    "pbx_region": "category",
+    "call_type": "category",
+    "number": str,
+    "used_number": str,
+    "all_duration_of_call_sec_str": str,
+    # Nullable, a blank cell is filled from duration_of_call_sec_str
+    "duration_of_call_sec": "Int64",
+    "duration_of_call_sec_str": str,
+    "dial_starts_at": str,
+    "dial_answered_at": str,
+    "dial_ends_at": str,
+    "discount": "float64",
+    "call_id": str,
+}
+# Console text columns whose blank cells the merge reads as "nan"
+CONSOLE_TEXT_COLUMNS = ("call_type", "number", "used_number", "call_id")
+
+# Columns of the merged CSV, in order
+MERGED_COLUMNS = [
+    "Sequence ID",
+    "User name",
+    "Call from",
+    "Call to",
+    "Call type",
+    "Number type",
+    "Dial starts at",
+    "Dial answered at",
+    "Dial ends at",
+    "Ringing time",
+    "Call duration",
+    "Call memo",
+    "Call charge",
+    "Round up duration",
+]
+# Merged CSV columns holding a call field as it is, by field. The other
+# columns are formatted text, except Round up duration.
+UNFORMATTED_COLUMNS = {
+    "Sequence ID": "sequence_id",
+    "Call from": "call_from",
+    "Call to": "call_to",
+    "Call type": "call_type",
+    "Number type": "number_type",
+    "Call memo": "call_memo",
+    "Call charge": "call_charge",
+}
+# Timestamp and duration fields of the merged CSV and their columns
+TYPED_OUTPUT_COLUMNS = {
+    "dial_start_at": "Dial starts at",
+    "dial_answered_at": "Dial answered at",
+    "dial_end_at": "Dial ends at",
+    "ringing_time": "Ringing time",
+    "call_duration": "Call duration",
+}
+# Calls save_merged_csv formats and writes at a time
+SAVE_BATCH_SIZE = 10_000
+
+# Call type normalization mapping for console exports
+CALL_TYPE_MAPPING = {
+    "OUTGOING_CALL": "Outbound call",
+    "OUTGOING_CALL_ABSENCE": "Outbound call (No answer)",
+}
+
+
 def process_dashboard_csv(
-    file_path: str, carrier: str, call_details: Optional[dict[str, CallDetail]] = None, client: str = ""
-) -> dict[str, CallDetail]:
+    file_path: str,
+    carrier: str,
+    call_details: Optional[dict[int, CallDetail] | CallBatch] = None,
+    client: str = "",
+    columnar: bool = True,
+    client_entry: Optional[ClientEntry] = None,
+    cache: Optional[ParsedInputCache] = None,
+) -> dict[int, CallDetail] | CallBatch:
+    """Merges a dashboard export into call_details and returns it.
+
+    The columnar reader merges into a CallBatch, the row-by-row reader
+    (columnar=False) into a dict of CallDetail objects keyed by call key.
+    A new one is started when call_details is not given. The calls of a
+    CallBatch are classified and charged once the console rows are merged,
+    see charge_calls.
+    """
     if call_details is None:
-        call_details = {}
+        call_details = CallBatch() if columnar else {}
+    check_call_store(call_details, columnar)
 
     print(f"- Reading dashboard file {file_path}...")
+    if client_entry is None:
+        client_entry = CLIENT_REGISTRY.get(client)
+    if columnar:
+        if cache is not None:
+            df1 = cache.read(file_path, read_dashboard_csv, (DASHBOARD_SCHEMA, DASHBOARD_NULL_PLACEHOLDERS))
+        else:
+            df1 = read_dashboard_csv(file_path)
+        return merge_dashboard_batch(df1, carrier, call_details, client=client, client_entry=client_entry)
+
     df1 = pd.read_csv(file_path, low_memory=False).astype(str)
+
     for index, row in df1.iterrows():
         call_detail = CallDetail(
             client=client,
+            client_entry=client_entry,
             sequence_id=row["Sequence ID"],
             user_name=row["User name"],
             call_from=row["Call from"],
@@ -32,63 +175,136 @@ def process_dashboard_csv(
             call_charge="0",
             carrier=carrier,
         )
-        key = call_detail.hash_key()
+        key = resolve_call_key(call_details, call_detail.call_from, call_detail.call_to, call_detail.dial_start_at)
         if key in call_details:
             # If the call is already in the dictionary, update it with the information from the dashboard file
             existing_call_detail = call_details[key]
             existing_call_detail.user_name = row["User name"]
             existing_call_detail.call_memo = row["Call memo"]
         else:
-            call_details[call_detail.hash_key()] = call_detail
+            call_details[key] = call_detail
     return call_details
 
 
+def read_dashboard_csv(file_path: str) -> pd.DataFrame:
+    """Reads the DASHBOARD_SCHEMA columns of a dashboard export.
+
+    Numbers come back cleaned, timestamps as datetime64 and durations as
+    timedelta64 columns. Blank text cells read "nan", like in the row-by-row
+    reader, other blanks and the dashboard's "-" placeholders are nulls.
+    """
+    return normalize_dashboard_frame(
+        pd.read_csv(
+            file_path,
+            usecols=list(DASHBOARD_SCHEMA),
+            dtype=DASHBOARD_SCHEMA,
+            na_values=DASHBOARD_NULL_PLACEHOLDERS,
+        )
+    )
+
+
+def read_dashboard_chunks(file_path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """read_dashboard_csv for at most chunksize rows at a time."""
+    chunks = pd.read_csv(
+        file_path,
+        usecols=list(DASHBOARD_SCHEMA),
+        dtype=DASHBOARD_SCHEMA,
+        na_values=DASHBOARD_NULL_PLACEHOLDERS,
+        chunksize=chunksize,
+    )
+    with chunks:
+        for chunk in chunks:
+            yield normalize_dashboard_frame(chunk)
+
+
+def normalize_dashboard_frame(df1: pd.DataFrame) -> pd.DataFrame:
+    fill_missing_text(df1, DASHBOARD_TEXT_COLUMNS)
+    for column in ("Call from", "Call to"):
+        df1[column] = parse_phone_number_column(df1[column])
+    for column in ("Dial begin time", "Call begin time", "Call end time"):
+        df1[column] = parse_iso_datetime_column(df1[column])
+    for column in ("Ringing time", "Call duration"):
+        df1[column] = parse_time_duration_column(df1[column])
+    return df1
+
+
 def process_console_csv(
-    file_path: str, carrier: str, call_details: dict[str, CallDetail], client: str = ""
-) -> dict[str, CallDetail]:
-    df2 = pd.read_csv(file_path, low_memory=False).astype(str)
+    file_path: str,
+    carrier: str,
+    call_details: dict[int, CallDetail] | CallBatch,
+    client: str = "",
+    columnar: bool = True,
+    client_entry: Optional[ClientEntry] = None,
+    cache: Optional[ParsedInputCache] = None,
+    match_tolerance: Optional[timedelta] = None,
+) -> dict[int, CallDetail] | CallBatch:
+    """Merges a console export into call_details, a CallBatch for the columnar
+    reader or a dict of CallDetail objects for the row-by-row one, and returns it.
+
+    With a match_tolerance, console rows whose key is unknown are also joined
+    to the known call with the same numbers whose dial start is nearest
+    within the tolerance, see merge_console_batch. The calls of a CallBatch
+    are classified and charged last, see charge_calls.
+    """
+    check_call_store(call_details, columnar)
+    if match_tolerance is not None and not columnar:
+        raise ValueError("The time-tolerant join needs the columnar readers")
+    if client_entry is None:
+        client_entry = CLIENT_REGISTRY.get(client)
+    if columnar:
+        if cache is not None:
+            df2 = cache.read(file_path, read_console_csv, CONSOLE_SCHEMA)
+        else:
+            df2 = read_console_csv(file_path)
+        merge_console_batch(
+            df2, carrier, call_details, client=client, client_entry=client_entry, match_tolerance=match_tolerance
+        )
+        return charge_calls(call_details)
 
-    # Call type normalization mapping
-    call_type_mapping = {
-        "OUTGOING_CALL": "Outbound call",
-        "OUTGOING_CALL_ABSENCE": "Outbound call (No answer)",
-    }
+    df2 = pd.read_csv(file_path, low_memory=False).astype(str)
 
+    sequence_ids = index_sequence_ids(call_details)
     for index, row in df2.iterrows():
         # Normalize phone numbers before processing
         normalized_call_from = parse_phone_number(row["used_number"])
         normalized_call_to = parse_phone_number(row["number"])
 
         # Check if the call is already in the call_details dictionary
-        key = call_hash(normalized_call_from, normalized_call_to, parse_jakarta_datetime(row["dial_starts_at"], row["pbx_region"]))
+        key = resolve_call_key(
+            call_details,
+            normalized_call_from,
+            normalized_call_to,
+            parse_region_datetime(row["dial_starts_at"], row["pbx_region"]),
+        )
 
-        call_type = call_type_mapping.get(row["call_type"], row["call_type"])
+        call_type = CALL_TYPE_MAPPING.get(row["call_type"], row["call_type"])
 
         if key in call_details:
             # If the call is already in the dictionary, update it with the information from the console file
             call_detail = call_details[key]
-            call_detail.call_type = call_type
-            call_detail.dial_answered_at = parse_jakarta_datetime(row["dial_answered_at"], row["pbx_region"])
-            call_detail.dial_end_at = parse_jakarta_datetime(row["dial_ends_at"], row["pbx_region"])
-            call_detail.ringing_time = row["all_duration_of_call_sec_str"]
-            call_detail.call_duration = row["duration_of_call_sec_str"]
+            call_detail.set_call_type(call_type)
+            call_detail.dial_answered_at = parse_region_time(row["dial_answered_at"], row["pbx_region"])
+            call_detail.dial_end_at = parse_region_time(row["dial_ends_at"], row["pbx_region"])
+            call_detail.ringing_time = parse_time_duration(row["all_duration_of_call_sec_str"])
+            call_detail.call_duration = parse_time_duration(row["duration_of_call_sec_str"])
             call_detail.call_memo = ""
             call_detail.call_charge = row["discount"]
         else:
             # If the call is not in the dictionary, check for sequence_id
             sequence_id = row["call_id"]  # Assuming call_id is the sequence_id in the console file
-            if not any(call_detail.sequence_id == sequence_id for call_detail in call_details.values()):
+            if sequence_id not in sequence_ids:
                 # If the sequence_id does not exist in call_details, add it with a user name of "-"
                 call_detail = CallDetail(
                     client=client,
+                    client_entry=client_entry,
                     sequence_id=sequence_id,
                     user_name="-",
                     call_from=normalized_call_from,
                     call_to=normalized_call_to,
                     call_type=call_type,
-                    dial_start_at=parse_jakarta_datetime(row["dial_starts_at"], row["pbx_region"]),
-                    dial_answered_at=parse_jakarta_datetime(row["dial_answered_at"], row["pbx_region"]),
-                    dial_end_at=parse_jakarta_datetime(row["dial_ends_at"], row["pbx_region"]),
+                    dial_start_at=parse_region_datetime(row["dial_starts_at"], row["pbx_region"]),
+                    dial_answered_at=parse_region_datetime(row["dial_answered_at"], row["pbx_region"]),
+                    dial_end_at=parse_region_datetime(row["dial_ends_at"], row["pbx_region"]),
                     ringing_time=row["all_duration_of_call_sec_str"],
                     call_duration=row["duration_of_call_sec_str"],
                     call_memo="",
@@ -96,12 +312,329 @@ def process_console_csv(
                     carrier=carrier,
                 )
                 call_details[key] = call_detail
+                sequence_ids.add(sequence_id)
     return call_details
 
 
+def check_call_store(call_details: dict[int, CallDetail] | CallBatch, columnar: bool) -> None:
+    """Raises when call_details is not the store the chosen reader merges into."""
+    if columnar and not isinstance(call_details, CallBatch):
+        raise ValueError("The columnar readers merge into a CallBatch")
+    if not columnar and isinstance(call_details, CallBatch):
+        raise ValueError("A CallBatch can only be merged with the columnar readers")
+
+
+def print_match_stats(matches: ConsoleMatches) -> None:
+    print(
+        f"- Matched {matches.exact + matches.tolerant} of {matches.rows} console rows to known calls "
+        f"({matches.match_rate:.1%}), {matches.tolerant} of them within {matches.tolerance.total_seconds():g}s"
+    )
+
+
+def print_classification_stats(classified: ClassifiedBatch) -> None:
+    print(
+        f"- Classified {classified.rows} calls from {classified.unique} distinct numbers "
+        f"({classified.hit_ratio:.1%} deduplicated)"
+    )
+
+
+def resolve_call_key(call_details: dict[int, CallDetail], call_from, call_to, dial_start_at) -> int:
+    """The key of one call in call_details, collisions resolved like
+    resolve_call_keys resolves them."""
+    key = call_key(call_from, call_to, dial_start_at)
+    identity = call_identity(call_from, call_to, dial_start_at)
+    while key in call_details and call_details[key].identity() != identity:
+        key = probe_call_key(key)
+    return key
+
+
+def call_keys(batch: CallBatch, identities: pd.DataFrame) -> pd.Series:
+    """The keys of the calls of a call_identity_frame in batch."""
+    return resolve_call_keys(identities, batch.stored_identities)
+
+
+def index_sequence_ids(call_details: dict[int, CallDetail]) -> set[str]:
+    """Sequence IDs of every known call. Console rows whose call_id is already
+    known are skipped; callers add the IDs of the calls they create."""
+    return {call_detail.sequence_id for call_detail in call_details.values()}
+
+
+def read_console_csv(file_path: str) -> pd.DataFrame:
+    """Reads the columns of a console export that the merge uses, with their
+    CONSOLE_SCHEMA dtypes and the numbers cleaned. Blank text cells read "nan",
+    like in the row-by-row reader, other missing values stay NaN."""
+    return normalize_console_frame(pd.read_csv(file_path, usecols=list(CONSOLE_SCHEMA), dtype=CONSOLE_SCHEMA))
+
+
+def read_console_chunks(file_path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """read_console_csv for at most chunksize rows at a time."""
+    with pd.read_csv(file_path, usecols=list(CONSOLE_SCHEMA), dtype=CONSOLE_SCHEMA, chunksize=chunksize) as chunks:
+        for chunk in chunks:
+            yield normalize_console_frame(chunk)
+
+
+def fill_missing_text(frame: pd.DataFrame, columns) -> None:
+    """Writes "nan" into the missing cells of the text columns, the text
+    astype(str) makes of them in the row-by-row readers."""
+    for column in columns:
+        values = frame[column]
+        if not values.isna().any():
+            continue
+        if isinstance(values.dtype, pd.CategoricalDtype) and "nan" not in values.cat.categories:
+            values = values.cat.add_categories("nan")
+        frame[column] = values.fillna("nan")
+
+
+def normalize_console_frame(df2: pd.DataFrame) -> pd.DataFrame:
+    fill_missing_text(df2, CONSOLE_TEXT_COLUMNS)
+    missing = df2["duration_of_call_sec"].isna()
+    if missing.any():
+        df2.loc[missing, "duration_of_call_sec"] = (
+            parse_time_duration_column(df2["duration_of_call_sec_str"][missing]) // timedelta(seconds=1)
+        )
+    for column in ("used_number", "number"):
+        df2[column] = parse_phone_number_column(df2[column])
+    return df2
+
+
+def merge_dashboard_batch(
+    df1: pd.DataFrame,
+    carrier: str,
+    batch: CallBatch,
+    client: str = "",
+    client_entry: Optional[ClientEntry] = None,
+) -> CallBatch:
+    """Columnar version of the dashboard merge, for frames read with read_dashboard_csv.
+
+    Memos and hash keys are parsed for the whole frame at once, and the new
+    calls are appended to batch column by column, without creating
+    CallDetail objects. They are classified and charged later, by
+    charge_calls. The result is the same as the row-by-row loop in
+    process_dashboard_csv.
+    """
+    batch.client_entries[client] = client_entry
+    keys = call_keys(batch, call_identity_frame(df1["Call from"], df1["Call to"], df1["Dial begin time"]))
+    # The first row of every new key creates a call
+    creates = (batch.positions(keys) == -1) & ~keys.duplicated().to_numpy()
+    new = df1[creates]
+    batch.append(
+        key=keys[creates],
+        client=np.full(len(new), client, dtype=object),
+        carrier=np.full(len(new), carrier, dtype=object),
+        sequence_id=new["Sequence ID"],
+        user_name=new["User name"],
+        call_from=new["Call from"],
+        call_to=new["Call to"],
+        call_type=new["Call type"].astype(object),
+        dial_start_at=new["Dial begin time"],
+        dial_answered_at=new["Call begin time"],
+        dial_end_at=new["Call end time"],
+        ringing_time=new["Ringing time"],
+        call_duration=new["Call duration"],
+        call_memo=parse_call_memo_column(new["Call memo"]),
+    )
+
+    # The other rows of a key update its call with their raw name and memo,
+    # so the last of them wins
+    updates = ~creates
+    if updates.any():
+        targets = batch.positions(keys[updates])
+        last = ~pd.Series(targets).duplicated(keep="last").to_numpy()
+        batch.set("user_name", targets[last], df1["User name"][updates][last])
+        batch.set("call_memo", targets[last], df1["Call memo"][updates][last])
+    return batch
+
+
+def merge_console_batch(
+    df2: pd.DataFrame,
+    carrier: str,
+    batch: CallBatch,
+    client: str = "",
+    client_entry: Optional[ClientEntry] = None,
+    sequence_ids: Optional[set[str]] = None,
+    match_tolerance: Optional[timedelta] = None,
+) -> CallBatch:
+    """Columnar version of the console merge, for frames read with read_console_csv.
+
+    Call type mapping, UTC to PBX region time conversion and key
+    construction run on whole columns. Rows that hit a known call update it.
+    The other rows are walked once, on their key and call ID only, to decide
+    which ones create a call, which ones update a call an earlier row created
+    and which ones are skipped, exactly as the row-by-row merge does. The
+    created calls are then appended column by column, and left for
+    charge_calls to classify and charge.
+
+    sequence_ids are the IDs of the known calls, taken from batch when not
+    given. The IDs of the calls this adds are added to it.
+
+    Dashboard and console keys never agree, dashboard dial starts are in UTC
+    and console ones in PBX region time, so by default console rows only find
+    dashboard calls through their sequence ID. With a match_tolerance the rows
+    whose key is unknown are joined, by call_from and call_to, to the known
+    call whose dial start is nearest, when it is within the tolerance. Such a
+    row only brings the console timings, see update_console_timings.
+    """
+    batch.client_entries[client] = client_entry
+    regions = df2["pbx_region"]
+    call_from = df2["used_number"]
+    call_to = df2["number"]
+    call_type = df2["call_type"].map(lambda value: CALL_TYPE_MAPPING.get(value, value)).astype(object)
+    dial_start_at = convert_to_region_time_column(df2["dial_starts_at"], regions)
+    dial_answered_at = convert_to_region_time_column(df2["dial_answered_at"], regions)
+    dial_end_at = convert_to_region_time_column(df2["dial_ends_at"], regions)
+    identities = call_identity_frame(call_from, call_to, dial_start_at)
+    keys = call_keys(batch, identities)
+    positions = batch.positions(keys)
+    matched = positions != -1
+
+    joined = np.zeros(len(df2), dtype=bool)
+    if match_tolerance is not None:
+        nearest = np.full(len(df2), -1)
+        nearest[~matched] = match_within_tolerance(
+            identities[~matched], batch.identities(np.arange(len(batch))), match_tolerance
+        )
+        joined = nearest != -1
+        print_match_stats(ConsoleMatches(len(df2), int(matched.sum()), int(joined.sum()), match_tolerance))
+
+    if sequence_ids is None:
+        sequence_ids = batch.sequence_ids()
+    creates = np.zeros(len(df2), dtype=bool)
+    updated_rows = []
+    created_keys = set()
+    key_values = keys.to_numpy(dtype=object)
+    call_ids = df2["call_id"].to_numpy(dtype=object)
+    for row in np.flatnonzero(~matched & ~joined):
+        key = key_values[row]
+        if key in created_keys:
+            # An earlier console row in this file created the call
+            updated_rows.append(row)
+        elif call_ids[row] not in sequence_ids:
+            created_keys.add(key)
+            sequence_ids.add(call_ids[row])
+            creates[row] = True
+
+    # Ringing times are only parsed for the rows that end up in a call
+    used = matched | joined | creates
+    used[updated_rows] = True
+    ringing_time = pd.Series(pd.NaT, index=df2.index, dtype="timedelta64[ns]")
+    ringing_time[used] = parse_time_duration_column(df2["all_duration_of_call_sec_str"][used]).to_numpy()
+    call_duration = pd.to_timedelta(df2["duration_of_call_sec"], unit="s")
+    updates = pd.DataFrame({
+        "call_type": call_type,
+        "dial_answered_at": dial_answered_at,
+        "dial_end_at": dial_end_at,
+        "ringing_time": ringing_time,
+        "call_duration": call_duration,
+        # Console charges are kept as text, the way the export showed them
+        "call_charge": df2["discount"].astype(str),
+    })
+    update_console_calls(batch, positions[matched], updates[matched])
+    if match_tolerance is not None:
+        update_console_timings(batch, nearest[joined], updates[joined])
+
+    created = int(creates.sum())
+    batch.append(
+        key=keys[creates],
+        client=np.full(created, client, dtype=object),
+        carrier=np.full(created, carrier, dtype=object),
+        sequence_id=df2["call_id"][creates],
+        user_name=np.full(created, "-", dtype=object),
+        call_from=call_from[creates],
+        call_to=call_to[creates],
+        call_type=call_type[creates],
+        dial_start_at=dial_start_at[creates],
+        dial_answered_at=dial_answered_at[creates],
+        dial_end_at=dial_end_at[creates],
+        ringing_time=ringing_time[creates],
+        call_duration=call_duration[creates],
+        call_memo=np.full(created, "-", dtype=object),
+    )
+    if updated_rows:
+        update_console_calls(batch, batch.positions(key_values[updated_rows]), updates.iloc[updated_rows])
+    return batch
+
+
+def update_console_calls(batch: CallBatch, targets: np.ndarray, updates: pd.DataFrame) -> None:
+    """Applies console rows to the calls at targets, like the update branch of
+    the row-by-row merge. When several rows hit one call the last one wins.
+    """
+    if not len(targets):
+        return
+    last = ~pd.Series(targets).duplicated(keep="last").to_numpy()
+    targets = targets[last]
+    updates = updates[last]
+    batch.set("call_type", targets, updates["call_type"])
+    # The number type depends on the call type, so charge_calls classifies it again
+    batch.set("number_type", targets, np.full(len(targets), None, dtype=object))
+    for name in ("dial_answered_at", "dial_end_at", "ringing_time", "call_duration", "call_charge"):
+        batch.set(name, targets, updates[name])
+    batch.set("call_memo", targets, np.full(len(targets), "", dtype=object))
+
+
+def update_console_timings(batch: CallBatch, targets: np.ndarray, updates: pd.DataFrame) -> None:
+    """Applies the rows the time-tolerant join matched to the calls at targets.
+    When several rows hit one call the last one wins.
+
+    Only the answer and end times, the ringing time and the duration are
+    taken from the console. The times are stored in the UTC offset of each
+    call's dial start. The call keeps its user name, memo and call type, and
+    is charged again on the console duration by charge_calls, with its
+    tariff rather than the console discount.
+    """
+    if not len(targets):
+        return
+    last = ~pd.Series(targets).duplicated(keep="last").to_numpy()
+    targets = targets[last]
+    updates = updates[last]
+    offsets = batch.columns["dial_start_at_offset"][targets]
+    for name in ("dial_answered_at", "dial_end_at"):
+        epochs, _ = encode_timestamp_column(updates[name])
+        batch.set_encoded(name, targets, epochs, np.where(epochs == NAT, 0, offsets))
+    for name in ("ringing_time", "call_duration"):
+        batch.set(name, targets, updates[name])
+    batch.set("call_charge", targets, np.full(len(targets), None, dtype=object))
+
+
+def charge_calls(batch: CallBatch) -> CallBatch:
+    """Classifies and charges the calls of batch that are not yet, and returns it.
+
+    The columnar merges leave the number type and the charge of the calls
+    they create empty. An update by a console row empties the number type
+    again, and a time-tolerant match empties the charge. They are worked out here once the merge is done with the
+    calls, so no call is charged twice: at the end of process_console_csv,
+    and for calls still left, when the batch is saved. Charges a console row
+    wrote are kept. Every client's calls are charged with the ClientEntry
+    its merge recorded in batch.client_entries.
+    """
+    unclassified = np.flatnonzero(pd.isna(batch.columns["number_type"]))
+    if len(unclassified):
+        classified = classify_batch(
+            pd.Series(batch.columns["call_to"][unclassified], dtype=object),
+            pd.Series(batch.columns["call_type"][unclassified], dtype=object),
+            pd.Series(batch.columns["call_from"][unclassified], dtype=object),
+        )
+        print_classification_stats(classified)
+        batch.set("number_type", unclassified, classified.number_type)
+
+    uncharged = np.flatnonzero(pd.isna(batch.columns["call_charge"]))
+    calls = pd.DataFrame({
+        "client": batch.columns["client"][uncharged],
+        "call_to": batch.columns["call_to"][uncharged],
+        "call_from": batch.columns["call_from"][uncharged],
+        "call_type": batch.columns["call_type"][uncharged],
+        "number_type": batch.columns["number_type"][uncharged],
+        "call_duration": batch.columns["call_duration"][uncharged].view("timedelta64[s]"),
+    })
+    for client, rows in calls.groupby("client", sort=False).indices.items():
+        client_entry = batch.client_entries.get(client, CLIENT_REGISTRY.get(client))
+        call_charge = charge_batch(calls.iloc[rows], client_entry.files if client_entry is not None else None)
+        batch.set("call_charge", uncharged[rows], call_charge)
+    return batch
+
+
 def process_merged_csv(
-    file_path: str, call_details: dict[str, CallDetail]
-) -> dict[str, CallDetail]:
+    file_path: str, call_details: dict[int, CallDetail]
+) -> dict[int, CallDetail]:
     """Reads a merged file and loads it to memory.
     Username, Call from, Call to, Call type, Dial starts at, Dial answered at, Dial ends at,
     Ringing time, Call duration,Call memo,Call charge
@@ -144,13 +677,139 @@ def round_up_duration(call_duration: str) -> int:
         return 0
 
 
-def save_merged_csv(call_details: dict[str, CallDetail], output_path: str) -> None:
+def save_merged_csv(
+    call_details: dict[int, CallDetail] | CallBatch, output_path: str, batch_size: int = SAVE_BATCH_SIZE
+) -> None:
+    """Writes the calls to output_path, batch_size calls at a time.
+
+    Only one batch of formatted rows is in memory at once. The file is the
+    one merged_frame(call_details).to_csv would write: column types are
+    decided over all calls before the first batch is written, so e.g. a
+    number column with one missing value prints every number as a float.
+    """
     print("- Saving merged CSV file...")
-    call_details_list = []
-    for key, value in call_details.items():
-        call_dict = value.to_dict()
-        call_dict["Round up duration"] = round_up_duration(call_dict["Call duration"])
-        call_details_list.append(call_dict)
-    
-    df = pd.DataFrame(call_details_list)
-    df.to_csv(output_path, index=False)
\ No newline at end of file
+    if isinstance(call_details, CallBatch):
+        charge_calls(call_details)
+    if not len(call_details):
+        pd.DataFrame([]).to_csv(output_path, index=False)
+        return
+
+    dtypes = merged_dtypes(call_details, batch_size)
+    # newline="" and the default line terminator, like to_csv opening the path itself
+    with open(output_path, "w", newline="", encoding="utf-8") as file:
+        for number, calls in enumerate(_call_batches(call_details, batch_size)):
+            frame = pd.DataFrame(merged_columns(calls), dtype=object).astype(dtypes)
+            frame.to_csv(file, index=False, header=number == 0)
+
+
+def _call_batches(call_details: dict[int, CallDetail] | CallBatch, batch_size: int) -> Iterator[list[CallDetail] | CallBatch]:
+    """The calls in insertion order, batch_size at a time."""
+    if isinstance(call_details, CallBatch):
+        for start in range(0, len(call_details), batch_size):
+            yield call_details.select(np.arange(start, min(start + batch_size, len(call_details))))
+        return
+
+    values = iter(call_details.values())
+    while calls := list(itertools.islice(values, batch_size)):
+        yield calls
+
+
+def merged_dtypes(call_details: dict[int, CallDetail] | CallBatch, batch_size: int = SAVE_BATCH_SIZE) -> dict[str, np.dtype]:
+    """The column types pandas infers for the output rows of all the calls.
+
+    The formatted columns are text and Round up duration is int64. For the
+    columns taken from the calls as they are, pandas only looks at which
+    Python types occur, and at the range of the ints, so one value of every
+    type and the smallest and largest int stand in for the whole column.
+    """
+    samples = {column: {} for column in UNFORMATTED_COLUMNS}
+    for calls in _call_batches(call_details, batch_size):
+        for column, field in UNFORMATTED_COLUMNS.items():
+            if isinstance(calls, CallBatch):
+                values = calls.columns[field]
+            else:
+                values = [getattr(call, field) for call in calls]
+            sample = samples[column]
+            for kind in set(map(type, values)):
+                if kind is int:
+                    ints = [value for value in values if type(value) is int]
+                    sample["min"] = min(min(ints), sample.get("min", ints[0]))
+                    sample["max"] = max(max(ints), sample.get("max", ints[0]))
+                elif kind not in sample:
+                    sample[kind] = next(value for value in values if type(value) is kind)
+
+    dtypes = {column: np.dtype(object) for column in MERGED_COLUMNS}
+    dtypes["Round up duration"] = np.dtype(np.int64)
+    for column, sample in samples.items():
+        dtypes[column] = pd.Series(list(sample.values()), dtype=object).infer_objects().dtype
+    return dtypes
+
+
+def merged_frame(call_details: dict[int, CallDetail] | CallBatch) -> pd.DataFrame:
+    """The output rows of the calls, in insertion order."""
+    if not len(call_details):
+        return pd.DataFrame([])
+    calls = charge_calls(call_details) if isinstance(call_details, CallBatch) else list(call_details.values())
+    return pd.DataFrame(merged_columns(calls), dtype=object).infer_objects()
+
+
+def merged_columns(calls: list[CallDetail] | CallBatch) -> dict[str, list | np.ndarray]:
+    """The output columns of the calls, in MERGED_COLUMNS order.
+
+    Timestamps and durations are formatted column by column from their
+    encoded form, and Round up duration is worked out from the call
+    duration's seconds. Only CallDetail values that do not encode, like a
+    timestamp in a second timezone, go through the scalar formatters.
+    """
+    if isinstance(calls, CallBatch):
+        columns = {column: calls.values(field) for column, field in UNFORMATTED_COLUMNS.items()}
+        columns["User name"] = [format_username(value) for value in calls.values("user_name")]
+        encoded = {name: (calls.encoded(name), {}) for name in TYPED_OUTPUT_COLUMNS}
+    else:
+        columns = {column: [getattr(call, field) for call in calls] for column, field in UNFORMATTED_COLUMNS.items()}
+        columns["User name"] = [format_username(call.user_name) for call in calls]
+        encoded = {name: _encoded_call_field(calls, name) for name in TYPED_OUTPUT_COLUMNS}
+
+    for name, column in TYPED_OUTPUT_COLUMNS.items():
+        values, others = encoded[name]
+        if name in DURATION_COLUMNS:
+            formatted = format_seconds_as_timedelta(*values)
+            for position, value in others.items():
+                formatted[position] = format_timedelta(value)
+        else:
+            formatted = format_timestamp_codes_as_human_readable(*values)
+            for position, value in others.items():
+                formatted[position] = format_datetime_as_human_readable(value)
+        columns[column] = formatted
+
+    (seconds,), others = encoded["call_duration"]
+    round_up = round_up_minutes(seconds)
+    missing = seconds == NAT
+    for position in others:
+        round_up[position] = round_up_duration(columns["Call duration"][position])
+        missing[position] = False
+    if missing.any():
+        print(f"- Call duration missing for {missing.sum()} call(s), their Round up duration is 0")
+    columns["Round up duration"] = round_up
+    return {column: columns[column] for column in MERGED_COLUMNS}
+
+
+def round_up_minutes(seconds: np.ndarray) -> np.ndarray:
+    """round_up_duration over durations in whole seconds: the started minutes of
+    the time format_timedelta prints, 0 where missing (NAT)."""
+    return np.where(seconds == NAT, 0, (np.mod(seconds, 86_400) + 59) // 60)
+
+
+def _encoded_call_field(calls: list[CallDetail], name: str) -> tuple[tuple[np.ndarray, ...], dict[int, object]]:
+    """A timestamp or duration field of the calls as CallBatch.encoded gives it,
+    and the values that do not encode by position."""
+    duration = name in DURATION_COLUMNS
+    codes = [call.encoded(name) for call in calls]
+    others = {position: getattr(calls[position], name) for position, code in enumerate(codes) if code is None}
+    if others:
+        blank = (NAT,) if duration else (NAT, 0)
+        codes = [blank if code is None else code for code in codes]
+    columns = np.array(codes, dtype=np.int64).reshape(len(codes), 1 if duration else 2).T
+    if duration:
+        return (columns[0],), others
+    return (columns[0], columns[1].astype(np.int32)), others
@@ -1,4 +1,7 @@
 # International rates by carrier
+from typing import Optional
+
+from src.utils import known_number_types
 
 INTERNATIONAL_RATES = {
     "Indosat": {
@@ -126,4 +129,40 @@ INTERNATIONAL_RATES = {
         "International - GEO (Mobile)": 11500,
         "International - CUB": 17250
     },
-}
\ No newline at end of file
+}
+
+
+def find_international_rate(rate_map: dict[str, float], number_type: str) -> Optional[float]:
+    """Fuzzy rate match for a lowercased number type: the first rate whose name
+    contains the number type, or is contained in it."""
+    matched_key = next(
+        (k for k in rate_map if k.lower() in number_type or number_type in k.lower()),
+        None
+    )
+    return rate_map[matched_key] if matched_key else None
+
+
+def build_international_rate_index(rate_map: dict[str, float]) -> dict[str, Optional[float]]:
+    """Resolves the fuzzy match once for every number type classify_number can
+    produce, lowercased. The empty string stands for an unclassified number."""
+    number_types = {number_type.lower() for number_type in known_number_types()} | {""}
+    return {number_type: find_international_rate(rate_map, number_type) for number_type in number_types}
+
+
+# Carrier -> lowercased number type -> rate, None when no rate applies
+INTERNATIONAL_RATE_INDEX = {
+    carrier: build_international_rate_index(rate_map) for carrier, rate_map in INTERNATIONAL_RATES.items()
+}
+
+
+def international_rate_index(carrier: str) -> dict[str, Optional[float]]:
+    """Rate index of a carrier. Carriers without their own rates use Atlasat's."""
+    return INTERNATIONAL_RATE_INDEX.get(carrier.title(), INTERNATIONAL_RATE_INDEX["Atlasat"])
+
+
+def lookup_international_rate(rate_index: dict[str, Optional[float]], rate_map: dict[str, float], number_type: str) -> Optional[float]:
+    """Rate of a lowercased number type. Number types the index was not built
+    for are matched fuzzily once and then remembered."""
+    if number_type not in rate_index:
+        rate_index[number_type] = find_international_rate(rate_map, number_type)
+    return rate_index[number_type]
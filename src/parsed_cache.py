@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.run_manifest import code_fingerprint, file_digest
+
+try:
+    import pyarrow  # noqa: F401 - only needed by DataFrame.to_parquet
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DEFAULT_CACHE_DIR = ".auto-anna-cache"
+# Bump when the way entries are stored changes. Changes to what the readers
+# return are covered by the code fingerprint in every key.
+CACHE_VERSION = 1
+
+
+class ParsedInputCache:
+    """Typed input frames on disk, keyed by the content hash of the source file
+    and the fingerprint of the merge code, so a fix to a reader or a parser
+    never loads frames the old code produced.
+
+    Frames are stored as Parquet when pyarrow is installed. Frames Parquet
+    cannot hold, like the mixed int/str number columns, and every frame when
+    pyarrow is missing, are pickled instead. Entries are never evicted; delete
+    the directory to clear the cache.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, code: Optional[str] = None):
+        self.directory = directory
+        # run_manifest.code_fingerprint(), computed here when not passed in
+        self.code = code if code is not None else code_fingerprint()
+
+    def read(self, file_path: str, reader: Callable[[str], pd.DataFrame], schema) -> pd.DataFrame:
+        """reader(file_path), loaded from the cache when the file was read before.
+
+        schema is anything with a stable repr that changes whenever the
+        reader's output would, usually the reader's column schema.
+        """
+        digest = file_digest(file_path)
+        if digest is None:
+            # Let the reader raise its usual error
+            return reader(file_path)
+
+        key = self._key(digest, reader, schema)
+        frame = self._load(key)
+        if frame is None:
+            frame = reader(file_path)
+            self._store(key, frame)
+        return frame
+
+    def _key(self, digest: str, reader: Callable, schema) -> str:
+        reader_fingerprint = hashlib.sha256(
+            f"{CACHE_VERSION}:{self.code}:{reader.__name__}:{schema!r}".encode()
+        ).hexdigest()
+        return f"{reader.__name__}-{digest[:32]}-{reader_fingerprint[:16]}"
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def _load(self, key: str) -> Optional[pd.DataFrame]:
+        if HAS_PYARROW and os.path.exists(self._path(key, "parquet")):
+            frame = pd.read_parquet(self._path(key, "parquet"))
+            # Parquet gives missing strings back as None, the readers return NaN
+            for column in frame.select_dtypes(object):
+                frame[column] = frame[column].where(frame[column].notna(), np.nan)
+            return frame
+        if os.path.exists(self._path(key, "pickle")):
+            with open(self._path(key, "pickle"), "rb") as file:
+                return pickle.load(file)
+        return None
+
+    def _store(self, key: str, frame: pd.DataFrame) -> None:
+        # Workers may store the same entry at once, e.g. for the enduser and
+        # partner exports of a client, so every entry is written to a
+        # temporary file and then moved into place
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = self._path(key, f"{os.getpid()}.tmp")
+        if HAS_PYARROW:
+            try:
+                frame.to_parquet(temporary_path)
+                os.replace(temporary_path, self._path(key, "parquet"))
+                return
+            except (TypeError, ValueError, ImportError, pyarrow.lib.ArrowException):
+                pass
+        with open(temporary_path, "wb") as file:
+            pickle.dump(frame, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self._path(key, "pickle"))
@@ -0,0 +1,28 @@
+from datetime import timedelta, timezone
+
+# UTC offset of every PBX region, keyed by the console's pbx_region code.
+# Indonesia spans three zones: WIB (UTC+7), WITA (UTC+8) and WIT (UTC+9).
+PBX_REGION_UTC_OFFSETS: dict[str, int] = {
+    "jkt": 7,  # Jakarta, WIB
+    "wib": 7,
+    "wita": 8,
+    "wit": 9,
+    "sg": 8,  # Singapore
+    "my": 8,  # Malaysia
+    "ph": 8,  # Philippines
+    "th": 7,  # Thailand
+    "vn": 7,  # Vietnam
+    "jp": 9,  # Japan
+}
+
+PBX_REGION_TIMEZONES: dict[str, timezone] = {
+    region: timezone(timedelta(hours=hours)) for region, hours in PBX_REGION_UTC_OFFSETS.items()
+}
+
+
+def region_timezone(region: str) -> timezone:
+    """Fixed-offset timezone of a PBX region."""
+    try:
+        return PBX_REGION_TIMEZONES[region.strip().lower()]
+    except (KeyError, AttributeError):
+        raise Exception(f"Timezone not supported for PBX region {region!r}.") from None
@@ -0,0 +1,38 @@
+from typing import Any, Iterator
+
+# Key under which a trie node stores the value of the prefix ending there.
+# Digits are always one-character strings, so None can never clash with them.
+_VALUE = None
+
+
+class PrefixTrie:
+    """Character trie over number prefixes.
+
+    Lookups walk the number once, so they cost O(len(number)) no matter how
+    many prefixes are stored.
+    """
+
+    def __init__(self):
+        self._root: dict = {}
+
+    def insert(self, prefix: str, value: Any) -> None:
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_VALUE] = value
+
+    def matches(self, number: str) -> Iterator[Any]:
+        """Yields the values of every stored prefix of number, shortest first."""
+        node = self._root
+        for char in number:
+            node = node.get(char)
+            if node is None:
+                return
+            if _VALUE in node:
+                yield node[_VALUE]
+
+    def longest_match(self, number: str, default: Any = None) -> Any:
+        result = default
+        for value in self.matches(number):
+            result = value
+        return result
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+
+from src import idn_area_codes
+from src.FileConfig import Files
+from src.international_rates import INTERNATIONAL_RATES
+from src.partner_rates import PARTNER_CALL_RATES
+
+MANIFEST_SUFFIX = ".manifest.json"
+# Bump when the manifest layout changes, so old manifests are never trusted
+MANIFEST_VERSION = 1
+
+SOURCE_DIR = Path(__file__).parent
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    """SHA-256 of a file's content, None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def config_fingerprint(files: Files) -> str:
+    """Fingerprint of a client's Files entry, paths and rates included."""
+    return _digest(json.dumps(asdict(files), sort_keys=True, default=str).encode())
+
+
+def rate_table_fingerprints() -> dict[str, str]:
+    """Fingerprints of the rate and number tables the merge reads. Their repr
+    keeps the insertion order, which matters for the international matching."""
+    tables = {
+        "INTERNATIONAL_RATES": INTERNATIONAL_RATES,
+        "PARTNER_CALL_RATES": PARTNER_CALL_RATES,
+        "EMERGENCY_NUMBERS": idn_area_codes.EMERGENCY_NUMBERS,
+        "PHONE_PREFIXES": idn_area_codes.PHONE_PREFIXES,
+        "INTERNATIONAL_PHONE_PREFIXES": idn_area_codes.INTERNATIONAL_PHONE_PREFIXES,
+    }
+    return {name: _digest(repr(table).encode()) for name, table in tables.items()}
+
+
+def code_fingerprint() -> str:
+    """Fingerprint of the merge code itself, so a fix to the charging or
+    formatting logic rebuilds every client."""
+    digest = hashlib.sha256()
+    for path in sorted(SOURCE_DIR.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def manifest_path(output_path: str) -> str:
+    return output_path + MANIFEST_SUFFIX
+
+
+def build_manifest(
+    files: Files,
+    rate_tables: dict[str, str],
+    code: str,
+    match_tolerance: Optional[timedelta] = None,
+    streaming: bool = False,
+) -> dict:
+    """Everything the output of a client depends on. The shared fingerprints
+    are computed once per run and passed in. A streaming merge writes its
+    rows grouped by day, so the mode is part of it too."""
+    return {
+        "version": MANIFEST_VERSION,
+        "client": files.client,
+        "dashboard": file_digest(files.dashboard),
+        "console": file_digest(files.console),
+        "config": config_fingerprint(files),
+        "rate_tables": rate_tables,
+        "code": code,
+        "match_tolerance": match_tolerance.total_seconds() if match_tolerance is not None else None,
+        "streaming": streaming,
+    }
+
+
+def read_manifest(output_path: str) -> Optional[dict]:
+    try:
+        with open(manifest_path(output_path)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(output_path: str, manifest: dict) -> None:
+    """Writes the manifest next to the output, through a temporary file so an
+    interrupted run never leaves a half-written manifest behind."""
+    path = manifest_path(output_path)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def is_up_to_date(files: Files, manifest: dict) -> bool:
+    """True when the output exists and was built from exactly these inputs.
+    Clients with a missing input are never up to date, so their error shows
+    up again on every run."""
+    if manifest["dashboard"] is None or manifest["console"] is None:
+        return False
+    return os.path.exists(files.output) and read_manifest(files.output) == manifest
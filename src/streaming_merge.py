@@ -0,0 +1,155 @@
+import os
+import pickle
+import tempfile
+from datetime import timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.call_batch import CallBatch
+from src.client_registry import CLIENT_REGISTRY, ClientEntry
+from src.csv_processing import (
+    merge_console_batch,
+    merge_dashboard_batch,
+    merged_frame,
+    read_console_chunks,
+    read_dashboard_chunks,
+    save_merged_csv,
+)
+from src.utils import CALL_IDENTITY_COLUMNS, call_identity_frame, epoch_column, parse_utc_datetime_column
+
+DEFAULT_CHUNK_SIZE = 100_000
+# Partition of the calls without a dial start time
+UNDATED = -1
+
+
+def utc_day_column(timestamps: pd.Series) -> np.ndarray:
+    """Days since the epoch of the UTC date of every timestamp, UNDATED where missing."""
+    instants = pd.to_datetime(timestamps, utc=True)
+    return np.where(instants.isna(), UNDATED, epoch_column(instants, unit="D"))
+
+
+class _Partitions:
+    """Chunks of an input, spilled to one file per dial-start day."""
+
+    def __init__(self, directory: str, kind: str):
+        self.directory = directory
+        self.kind = kind
+        # Days in order of first appearance
+        self.days: dict[int, None] = {}
+
+    def _path(self, day: int) -> str:
+        return os.path.join(self.directory, f"{self.kind}-{day}.pickle")
+
+    def spill(self, chunk: pd.DataFrame, days: np.ndarray) -> None:
+        for day, rows in chunk.groupby(days, sort=False):
+            self.days.setdefault(day)
+            with open(self._path(day), "ab") as file:
+                pickle.dump(rows, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, day: int) -> Optional[pd.DataFrame]:
+        if day not in self.days:
+            return None
+        chunks = []
+        with open(self._path(day), "rb") as file:
+            while True:
+                try:
+                    chunks.append(pickle.load(file))
+                except EOFError:
+                    break
+        os.remove(self._path(day))
+        return pd.concat(chunks)
+
+
+def stream_merge(
+    dashboard_path: str,
+    console_path: str,
+    carrier: str,
+    output_path: str,
+    client: str = "",
+    client_entry: Optional[ClientEntry] = None,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    match_tolerance: Optional[timedelta] = None,
+) -> None:
+    """Merges a dashboard and a console export into output_path with bounded memory.
+
+    Both inputs are read chunksize rows at a time and spilled to temporary
+    files, one per UTC day of the dial start. The days are then merged one by
+    one with the regular columnar merge, and each day's rows are appended to the
+    output as soon as it is done, so only one day of calls is in memory.
+
+    Call keys contain the dial start time, so calls with equal keys always share
+    a day. The sequence ID join is not bound to a day: the IDs of every
+    dashboard call are collected before the first day is merged and kept,
+    together with the IDs of the console calls added so far, for every day.
+
+    The rows match those of process_dashboard_csv, process_console_csv and
+    save_merged_csv, grouped by day in order of first appearance. Within a day
+    the dashboard calls come first, then the console calls, each in file order.
+
+    The time-tolerant join of match_tolerance only looks within a day, so a
+    console row does not join a call whose dial start falls on the other side
+    of UTC midnight.
+    """
+    if client_entry is None:
+        client_entry = CLIENT_REGISTRY.get(client)
+
+    with tempfile.TemporaryDirectory(prefix="auto-anna-") as directory:
+        dashboard = _Partitions(directory, "dashboard")
+        dashboard_keys = _Partitions(directory, "dashboard-keys")
+        console = _Partitions(directory, "console")
+
+        print(f"- Partitioning dashboard file {dashboard_path}...")
+        for chunk in read_dashboard_chunks(dashboard_path, chunksize):
+            days = utc_day_column(chunk["Dial begin time"])
+            dashboard.spill(chunk, days)
+            identities = call_identity_frame(chunk["Call from"], chunk["Call to"], chunk["Dial begin time"])
+            dashboard_keys.spill(identities.assign(sequence_id=chunk["Sequence ID"]), days)
+        print(f"- Partitioning console file {console_path}...")
+        for chunk in read_console_chunks(console_path, chunksize):
+            console.spill(chunk, utc_day_column(parse_utc_datetime_column(chunk["dial_starts_at"])))
+
+        # Only the first dashboard row of a call becomes a call, later ones just
+        # update it, so only the first row's ID is known to the console merge
+        sequence_ids: set[str] = set()
+        for day in dashboard_keys.days:
+            identities = dashboard_keys.load(day)
+            sequence_ids.update(identities.drop_duplicates(CALL_IDENTITY_COLUMNS)["sequence_id"])
+
+        print("- Merging and saving partitions...")
+        written = False
+        for day in {**dashboard.days, **console.days}:
+            calls = _merge_day(
+                dashboard.load(day), console.load(day), carrier, client, client_entry, sequence_ids, match_tolerance
+            )
+            if len(calls):
+                merged_frame(calls).to_csv(output_path, mode="a" if written else "w", header=not written, index=False)
+                written = True
+        if not written:
+            save_merged_csv(CallBatch(), output_path)
+
+
+def _merge_day(
+    df1: Optional[pd.DataFrame],
+    df2: Optional[pd.DataFrame],
+    carrier: str,
+    client: str,
+    client_entry: Optional[ClientEntry],
+    sequence_ids: set[str],
+    match_tolerance: Optional[timedelta],
+) -> CallBatch:
+    calls = CallBatch()
+    if df1 is not None:
+        merge_dashboard_batch(df1, carrier, calls, client=client, client_entry=client_entry)
+    if df2 is not None:
+        merge_console_batch(
+            df2,
+            carrier,
+            calls,
+            client=client,
+            client_entry=client_entry,
+            sequence_ids=sequence_ids,
+            match_tolerance=match_tolerance,
+        )
+    return calls
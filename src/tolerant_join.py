@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from src.batch_classification import factorize_columns
+from src.utils import NAT
+
+# Tolerance of --match-tolerance without a value. Dashboard dial starts carry
+# microseconds, console ones are cut to whole seconds.
+DEFAULT_MATCH_TOLERANCE = timedelta(seconds=1)
+
+
+@dataclass
+class ConsoleMatches:
+    """How the rows of a console file found the calls they belong to."""
+
+    rows: int
+    # Rows whose call key was known
+    exact: int
+    # Rows joined to a known call within the tolerance instead
+    tolerant: int
+    tolerance: timedelta
+
+    @property
+    def match_rate(self) -> float:
+        return (self.exact + self.tolerant) / self.rows if self.rows else 0.0
+
+
+def match_within_tolerance(rows: pd.DataFrame, calls: pd.DataFrame, tolerance: timedelta) -> np.ndarray:
+    """For every row of rows, the position in calls of the call with the same
+    call_from and call_to whose dial start is nearest to the row's, -1 when
+    there is none within tolerance. Both are call_identity_frames.
+
+    The dial starts are compared as instants, so a dashboard call in UTC and
+    a console row in its PBX region's time join when they are close enough.
+    Both sides are sorted once and joined with merge_asof, which takes
+    O((n + m) log(n + m)) time. Rows and calls without a dial start never join.
+    """
+    positions = np.full(len(rows), -1, dtype=np.int64)
+    # Number pairs as integer codes, merge_asof groups on those much faster
+    # than on the mixed int and str number columns
+    pairs, _ = factorize_columns(
+        pd.Series(np.concatenate([rows["call_from"].to_numpy(dtype=object), calls["call_from"].to_numpy(dtype=object)])),
+        pd.Series(np.concatenate([rows["call_to"].to_numpy(dtype=object), calls["call_to"].to_numpy(dtype=object)])),
+    )
+    left = pd.DataFrame({
+        "pair": pairs[: len(rows)],
+        "dial_start_epoch": rows["dial_start_epoch"].to_numpy(dtype=np.int64),
+        "row": np.arange(len(rows)),
+    })
+    right = pd.DataFrame({
+        "pair": pairs[len(rows):],
+        "dial_start_epoch": calls["dial_start_epoch"].to_numpy(dtype=np.int64),
+        "position": np.arange(len(calls)),
+    })
+    left = left[left["dial_start_epoch"] != NAT].sort_values("dial_start_epoch", kind="stable")
+    right = right[right["dial_start_epoch"] != NAT].sort_values("dial_start_epoch", kind="stable")
+    if left.empty or right.empty:
+        return positions
+
+    joined = pd.merge_asof(
+        left,
+        right,
+        on="dial_start_epoch",
+        by="pair",
+        direction="nearest",
+        tolerance=tolerance // timedelta(microseconds=1),
+    )
+    found = joined["position"].notna().to_numpy()
+    positions[joined["row"].to_numpy()[found]] = joined["position"].to_numpy()[found].astype(np.int64)
+    return positions
@@ -1,29 +1,254 @@
+import re
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
+import numpy as np
+import pandas as pd
+
 from src.idn_area_codes import EMERGENCY_NUMBERS, PHONE_PREFIXES, INTERNATIONAL_PHONE_PREFIXES
+from src.pbx_regions import region_timezone
+from src.prefix_trie import PrefixTrie
 
 SPECIAL_PREFIXES = [211500, 211400, 21150, 21140, 1500, 1400, 800, 84, 31, 21, 8]
 
-def call_hash(call_from: int, call_to: int, dial_start_at: datetime) -> str:
-    return f"{call_from}_{call_to}_{dial_start_at}".replace(" ", "_")
+# Prefix tables for classify_number, built once at import.
+# Domestic prefixes resolve to the longest match. Special and international
+# prefixes keep their table order: the first listed prefix that matches wins,
+# so their values carry the table position and lookups take the minimum.
+DOMESTIC_PREFIX_TRIE = PrefixTrie()
+for _prefix, _label in PHONE_PREFIXES.items():
+    DOMESTIC_PREFIX_TRIE.insert(str(_prefix), _label)
+
+SPECIAL_PREFIX_TRIE = PrefixTrie()
+for _position, _prefix in reversed(list(enumerate(SPECIAL_PREFIXES))):
+    SPECIAL_PREFIX_TRIE.insert(str(_prefix), (_position, PHONE_PREFIXES.get(_prefix)))
+
+INTERNATIONAL_PREFIX_TRIE = PrefixTrie()
+for _position, (_prefix, _country) in reversed(list(enumerate(INTERNATIONAL_PHONE_PREFIXES.items()))):
+    INTERNATIONAL_PREFIX_TRIE.insert(str(_prefix).replace("+", ""), (_position, f"International - {_country}"))
+
+# Missing timestamps, as epoch microseconds
+NAT = np.iinfo(np.int64).min
+# UTC offset of timestamps that have no timezone
+NAIVE = np.iinfo(np.int32).min
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+# "H:" of every hour of a day and "MM:SS" of every second of an hour, the
+# pieces format_timedelta prints for a whole-second duration
+_CLOCK_HOURS = np.array([f"{hour}:" for hour in range(24)], dtype=object)
+_CLOCK_MINUTES_SECONDS = np.array([f"{minute:02}:{second:02}" for minute in range(60) for second in range(60)], dtype=object)
+
+# A call is identified by its caller, its callee and the instant and UTC offset
+# of its dial start. Its key is a 64-bit hash of those, computed the same way
+# by call_key for one call and call_key_column for whole columns.
+#
+# Dashboard exports carry +00:00 and console exports the offset of their PBX
+# region, so dashboard and console calls never share a key, just like the
+# formatted key strings these replace never did.
+#
+# Collisions: two different calls may, very rarely, hash to the same key. The
+# resolve functions therefore compare the full identity of every call a key
+# hits. A call that does not match the call already stored under its key
+# moves on to probe_call_key(key), and so on until it finds itself or a free
+# key.
+CALL_IDENTITY_COLUMNS = ["call_from", "call_to", "dial_start_epoch", "dial_start_offset"]
+
+_MASK_64 = (1 << 64) - 1
+# Keeps a number given as text apart from the integer with the same hash
+_TEXT_NUMBER = 0x5851F42D4C957F2D
+_PROBE = 0x2545F4914F6CDD1D
+
+
+def _mix(value: int) -> int:
+    """SplitMix64 finalizer on a Python int."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return value ^ (value >> 31)
+
+def _mix_column(values: np.ndarray) -> np.ndarray:
+    """_mix on a uint64 array."""
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+def _is_key_int(number) -> bool:
+    return isinstance(number, (int, np.integer)) and not isinstance(number, bool) and 0 <= number < 1 << 63
+
+def _text_hash(numbers: np.ndarray) -> np.ndarray:
+    return pd.util.hash_array(numbers.astype(str).astype(object)) ^ np.uint64(_TEXT_NUMBER)
+
+def _number_code(number) -> int:
+    if _is_key_int(number):
+        return int(number)
+    return int(_text_hash(np.array([number], dtype=object))[0])
+
+def _number_code_column(numbers: pd.Series) -> np.ndarray:
+    values = numbers.to_numpy(dtype=object)
+    is_int = np.fromiter(map(_is_key_int, values), dtype=bool, count=len(values))
+    codes = np.empty(len(values), dtype=np.uint64)
+    codes[is_int] = values[is_int].astype(np.uint64)
+    if not is_int.all():
+        codes[~is_int] = _text_hash(values[~is_int])
+    return codes
+
+def timestamp_code(value) -> tuple[int, int]:
+    """Epoch microseconds and UTC offset in seconds of a datetime, or of the ISO
+    string of one. Missing values are (NAT, 0), naive ones have the NAIVE
+    offset and count their wall clock time."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if value not in ("-", "nan", "NaT") else None
+    if not isinstance(value, datetime) or value is pd.NaT:
+        return NAT, 0
+    if value.tzinfo is None:
+        return (value - _EPOCH) // _MICROSECOND, NAIVE
+    return (value - _EPOCH_UTC) // _MICROSECOND, value.utcoffset() // timedelta(seconds=1)
+
+def encode_timestamp_column(timestamps: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Column counterpart of timestamp_code. Object columns, such as those of
+    mixed-offset exports, are encoded value by value."""
+    if isinstance(timestamps.dtype, pd.DatetimeTZDtype):
+        wall_clock = timestamps.dt.tz_localize(None).to_numpy().astype("datetime64[us]").view("int64")
+        epochs = timestamps.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy().astype("datetime64[us]").view("int64")
+        offsets = np.where(epochs == NAT, 0, (wall_clock - epochs) // 1_000_000).astype(np.int32)
+        return epochs, offsets
+    if pd.api.types.is_datetime64_dtype(timestamps):
+        epochs = timestamps.to_numpy().astype("datetime64[us]").view("int64")
+        return epochs, np.where(epochs == NAT, 0, NAIVE).astype(np.int32)
+
+    epochs = np.empty(len(timestamps), dtype=np.int64)
+    offsets = np.empty(len(timestamps), dtype=np.int32)
+    for position, value in enumerate(timestamps):
+        epochs[position], offsets[position] = timestamp_code(value)
+    return epochs, offsets
+
+def call_identity(call_from: int | str, call_to: int | str, dial_start_at) -> tuple:
+    """What tells calls apart, in the order of CALL_IDENTITY_COLUMNS."""
+    return (call_from, call_to, *timestamp_code(dial_start_at))
+
+def call_identity_frame(call_from: pd.Series, call_to: pd.Series, dial_start_at: pd.Series) -> pd.DataFrame:
+    """Column counterpart of call_identity."""
+    epochs, offsets = encode_timestamp_column(dial_start_at)
+    return pd.DataFrame(
+        {
+            "call_from": call_from.to_numpy(dtype=object),
+            "call_to": call_to.to_numpy(dtype=object),
+            "dial_start_epoch": epochs,
+            "dial_start_offset": offsets,
+        },
+        index=call_from.index,
+    )
+
+def _signed(key: int) -> int:
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+def call_key(call_from: int | str, call_to: int | str, dial_start_at) -> int:
+    """The 64-bit key of a call, before collisions are resolved."""
+    _, _, epoch, offset = call_identity(call_from, call_to, dial_start_at)
+    key = _mix(_number_code(call_from))
+    key = _mix(key ^ _number_code(call_to))
+    key = _mix(key ^ (epoch & _MASK_64))
+    return _signed(_mix(key ^ (offset & _MASK_64)))
+
+def call_key_column(identities: pd.DataFrame) -> pd.Series:
+    """call_key of every row of a call_identity_frame, as an int64 column."""
+    keys = _mix_column(_number_code_column(identities["call_from"]))
+    keys = _mix_column(keys ^ _number_code_column(identities["call_to"]))
+    keys = _mix_column(keys ^ identities["dial_start_epoch"].to_numpy(dtype=np.int64).view(np.uint64))
+    offsets = identities["dial_start_offset"].to_numpy(dtype=np.int64).view(np.uint64)
+    return pd.Series(_mix_column(keys ^ offsets).view(np.int64), index=identities.index)
+
+def probe_call_key(key: int) -> int:
+    """The next key to try for a call whose key is taken by another call."""
+    return _signed(_mix((key & _MASK_64) ^ _PROBE))
+
+def same_identity(left: pd.DataFrame, right: pd.DataFrame) -> np.ndarray:
+    """Row-wise comparison of two aligned identity frames, missing numbers included."""
+    same = np.ones(len(left), dtype=bool)
+    for column in CALL_IDENTITY_COLUMNS:
+        a, b = left[column].to_numpy(), right[column].to_numpy()
+        same &= (a == b) | (pd.isna(a) & pd.isna(b))
+    return same
+
+def resolve_call_keys(identities: pd.DataFrame, stored_identities) -> pd.Series:
+    """The key of every row, collisions resolved as described above.
+
+    stored_identities(keys) returns the rows whose key is already taken, as a
+    mask, and the identities of the calls under those keys. Rows of one call
+    always share a key.
+    """
+    keys = call_key_column(identities)
+    calls = identities.groupby(CALL_IDENTITY_COLUMNS, sort=False, dropna=False).ngroup().to_numpy()
+    while True:
+        # Rows whose key is taken by a stored call that is not theirs
+        taken, stored = stored_identities(keys)
+        clashing = np.zeros(len(keys), dtype=bool)
+        clashing[taken] = ~same_identity(identities[taken], stored)
+        # Rows whose key an earlier row of another call already uses
+        first_call = pd.Series(calls).groupby(keys.to_numpy()).transform("first").to_numpy()
+        clashing |= calls != first_call
+        if not clashing.any():
+            return keys
+        keys[clashing] = [probe_call_key(key) for key in keys[clashing]]
+
+UTC_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-def convert_to_jakarta_time_iso(original_date_str: str, region: str) -> datetime:
-    if region != "jkt":
-        raise Exception(
-            "Timezone not supported. Only Jakarta time is supported for now."
-        )
+def convert_to_region_time_iso(original_date_str: str, region: str) -> datetime:
+    region_zone = region_timezone(region)
 
     # Parse the original date string in UTC time
-    original_date = datetime.strptime(original_date_str, "%Y-%m-%d %H:%M:%S")
-    utc_timezone = timezone.utc
-    original_date_utc = original_date.replace(tzinfo=utc_timezone)
+    original_date = datetime.strptime(original_date_str, UTC_TIMESTAMP_FORMAT)
+    original_date_utc = original_date.replace(tzinfo=timezone.utc)
 
-    # Add 7 hours to the original date to convert it to Jakarta time
-    jakarta_offset = timedelta(hours=7)
-    jakarta_date = original_date_utc + jakarta_offset
-    jakarta_date = jakarta_date.replace(tzinfo=timezone(timedelta(hours=7)))
-    return jakarta_date
+    # Shift to the local time of the PBX region
+    return original_date_utc.astimezone(region_zone)
+
+def parse_utc_datetime_column(datetime_strings: pd.Series) -> pd.Series:
+    """Parses UTC_TIMESTAMP_FORMAT strings to a datetime64[ns, UTC] column.
+    Missing and "nan" entries become NaT."""
+    missing = (datetime_strings.isna() | (datetime_strings == "nan")).to_numpy()
+    values = datetime_strings.to_numpy(dtype=object, copy=True)
+    # numpy parses ISO dates with a space separator much faster than strptime,
+    # but only without None in the way
+    values[missing] = "1970-01-01 00:00:00"
+    try:
+        parsed = values.astype("datetime64[s]")
+    except ValueError:
+        # Let pandas report the offending value against the expected format
+        parsed = pd.to_datetime(values, format=UTC_TIMESTAMP_FORMAT).to_numpy()
+    parsed[missing] = np.datetime64("NaT")
+    return pd.Series(parsed, index=datetime_strings.index).astype("datetime64[ns]").dt.tz_localize("UTC")
+
+def epoch_column(datetimes: pd.Series, unit: str = "s") -> np.ndarray:
+    """Integer epoch of a datetime column in the given numpy unit. NaT becomes
+    the minimum int64, numpy's own NaT value."""
+    return datetimes.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy().astype(f"datetime64[{unit}]").view("int64")
+
+def convert_to_region_time_column(datetime_strings: pd.Series, regions: pd.Series) -> pd.Series:
+    """Column counterpart of convert_to_region_time_iso, NaT where missing.
+
+    The strings are parsed once for the whole column. Every distinct region
+    is resolved to its timezone once, and the rows of each timezone are
+    shifted together. When all rows share a timezone the result is a
+    datetime64 column in that zone, otherwise an object column of datetimes
+    that each carry their own zone.
+    """
+    utc_dates = parse_utc_datetime_column(datetime_strings)
+    present = utc_dates.notna()
+    region_zones = {region: region_timezone(region) for region in pd.unique(regions[present])}
+    zones = set(region_zones.values())
+    if len(zones) <= 1:
+        return utc_dates.dt.tz_convert(zones.pop() if zones else timezone.utc)
+
+    local_dates = np.full(len(utc_dates), None, dtype=object)
+    zone_of_row = regions.map(region_zones).astype(object)
+    for zone in zones:
+        rows = (present & (zone_of_row == zone)).to_numpy()
+        local_dates[rows] = utc_dates[rows].dt.tz_convert(zone).array.to_pydatetime()
+    return pd.Series(local_dates, index=datetime_strings.index, dtype=object)
 
 import phonenumbers
 
@@ -49,6 +274,37 @@ def parse_phone_number(phone_number: int | str) -> int | str:
     except ValueError:
         return cleaned_number
 
+def _int_or_str(cleaned_number: str) -> int | str:
+    try:
+        return int(cleaned_number)
+    except ValueError:
+        return cleaned_number
+
+def parse_phone_number_column(phone_numbers: pd.Series) -> pd.Series:
+    """Column counterpart of parse_phone_number for a column of raw strings."""
+    cleaned = phone_numbers.str.replace(r"[+\-() ]", "", regex=True)
+    cleaned = cleaned.where(~cleaned.str.startswith("62", na=False), cleaned.str[2:])
+
+    # Plain ASCII digits that fit in int64 are converted in one go, anything else
+    # (scancall, masked numbers, "nan") goes through the scalar rules.
+    is_digits = cleaned.str.fullmatch(r"[0-9]{1,18}", na=False)
+    parsed = cleaned[~is_digits].map(_int_or_str)
+    digits = pd.Series(cleaned[is_digits].astype("int64").tolist(), index=cleaned.index[is_digits], dtype=object)
+    return pd.concat([digits, parsed]).reindex(cleaned.index)
+
+# Number types classify_number derives from the call type or caller alone
+CALL_TYPE_NUMBER_TYPES = ("Internal Call", "Internal Call (No answer)", "Voicemail", "Automatic Transfer", "Monitoring", "scancall")
+
+def known_number_types() -> set[str]:
+    """Every string classify_number can return."""
+    return {
+        *CALL_TYPE_NUMBER_TYPES,
+        *EMERGENCY_NUMBERS.values(),
+        *PHONE_PREFIXES.values(),
+        *(f"International - {country}" for country in INTERNATIONAL_PHONE_PREFIXES.values()),
+        "Unknown number type",
+    }
+
 def classify_number(phone_number: int, call_type: str, call_from: str, call_to: str) -> str:
     phone_number_str = str(phone_number)
 
@@ -74,23 +330,20 @@ def classify_number(phone_number: int, call_type: str, call_from: str, call_to:
         if classification:
             return classification
 
-    # Sort prefixes by length in descending order for matching
-    sorted_prefixes = sorted(map(str, PHONE_PREFIXES.keys()), key=len, reverse=True)
-
-    # Check for phone prefixes
-    for prefix in sorted_prefixes:
-        if phone_number_str.startswith(prefix):
-            return PHONE_PREFIXES.get(int(prefix))
+    # Check for phone prefixes, longest prefix first
+    domestic = DOMESTIC_PREFIX_TRIE.longest_match(phone_number_str)
+    if domestic is not None:
+        return domestic
 
     # Check against special prefixes
-    for prefix in SPECIAL_PREFIXES:
-        if phone_number_str.startswith(str(prefix)):
-            return PHONE_PREFIXES.get(prefix)
+    special = min(SPECIAL_PREFIX_TRIE.matches(phone_number_str), default=None)
+    if special is not None:
+        return special[1]
 
     # Check against international prefixes
-    for prefix, country in INTERNATIONAL_PHONE_PREFIXES.items():
-        if phone_number_str.startswith(str(prefix).replace("+", "")):
-            return f"International - {country}"
+    international = min(INTERNATIONAL_PREFIX_TRIE.matches(phone_number_str), default=None)
+    if international is not None:
+        return international[1]
 
     return "Unknown number type"
 
@@ -106,23 +359,90 @@ def format_timedelta(time_duration: timedelta) -> str:
     time_str = time_parts[-1]
     return time_str
 
-def format_username(user_name: str) -> str:
-    return user_name if user_name else "-"
+def format_timestamp_codes_as_human_readable(epochs: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """format_datetime_as_human_readable over timestamps encoded like
+    timestamp_code encodes them, as an object array."""
+    present = epochs != NAT
+    wall_clock = epochs[present] // 1_000_000 + np.where(offsets[present] == NAIVE, 0, offsets[present])
+    text = np.datetime_as_string(wall_clock.astype("datetime64[s]"), unit="s")
+    formatted = np.full(len(epochs), "-", dtype=object)
+    formatted[present] = pd.Series(text, dtype=object).str.replace("T", " ", regex=False).to_numpy()
+    return formatted
+
+def format_seconds_as_timedelta(seconds: np.ndarray) -> np.ndarray:
+    """format_timedelta over durations in whole seconds, NAT where missing, as
+    an object array. Whole days are left out and missing durations print as
+    None, like format_timedelta does."""
+    present = seconds != NAT
+    clock = np.mod(seconds[present], 86_400)
+    formatted = np.full(len(seconds), format_timedelta(None), dtype=object)
+    formatted[present] = _CLOCK_HOURS[clock // 3600] + _CLOCK_MINUTES_SECONDS[clock % 3600]
+    return formatted
+
+def format_username(user_name: Optional[str]) -> str:
+    # Names that are not text, like a NaN, print as missing
+    return user_name if isinstance(user_name, str) and user_name else "-"
 
 def parse_call_memo(memo: str) -> str:
     if memo == "" or memo == "nan":
         return "-"
     return memo
 
+def parse_call_memo_column(memos: pd.Series) -> pd.Series:
+    return memos.where(memos.notna() & ~memos.isin(["", "nan"]), "-")
+
 def parse_iso_datetime(datetime_str: str) -> datetime:
     return datetime.fromisoformat(datetime_str)
 
-def parse_jakarta_datetime(datetime_str: str, region: str) -> str:
+def parse_iso_datetime_column(datetime_strings: pd.Series) -> pd.Series:
+    """Column counterpart of parse_iso_datetime. Missing values become NaT."""
+    offsets = datetime_strings.dropna().str[-6:].unique()
+    if len(offsets) == 1 and re.fullmatch(r"[+-]\d{2}:\d{2}", offsets[0]):
+        # One shared UTC offset: parse the wall clock times on the fast naive
+        # path and attach the offset once, instead of once per string
+        sign = -1 if offsets[0][0] == "-" else 1
+        offset = timedelta(hours=int(offsets[0][1:3]), minutes=int(offsets[0][4:6]))
+        wall_clock = pd.to_datetime(datetime_strings.str[:-6], format="ISO8601")
+        return wall_clock.dt.tz_localize(timezone(sign * offset))
+
+    parsed = pd.to_datetime(datetime_strings, format="ISO8601")
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        # Mixed UTC offsets cannot share a dtype, keep the exact scalar objects instead
+        parsed = datetime_strings.map(lambda value: parse_iso_datetime(value) if isinstance(value, str) else None)
+    return parsed
+
+def parse_region_datetime(datetime_str: str, region: str) -> str:
     if datetime_str == "nan":
         return "-"
-    jakarta_iso_date = convert_to_jakarta_time_iso(datetime_str, region)
-    return format_datetime_as_iso(jakarta_iso_date)
+    region_iso_date = convert_to_region_time_iso(datetime_str, region)
+    return format_datetime_as_iso(region_iso_date)
+
+def parse_region_time(datetime_str: str, region: str) -> Optional[datetime]:
+    """parse_region_datetime as a datetime, None where missing."""
+    if datetime_str == "nan":
+        return None
+    return convert_to_region_time_iso(datetime_str, region)
 
 def parse_time_duration(time_duration_string: str) -> timedelta:
     hours, minutes, seconds = time_duration_string.split(":")
-    return timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds))
\ No newline at end of file
+    return timedelta(hours=int(hours), minutes=int(minutes), seconds=int(seconds))
+
+def parse_time_duration_column(time_duration_strings: pd.Series) -> pd.Series:
+    """Column counterpart of parse_time_duration, returning a timedelta64 column."""
+    if time_duration_strings.empty:
+        return pd.Series(index=time_duration_strings.index, dtype="timedelta64[ns]")
+    parts = time_duration_strings.str.split(":", expand=True)
+    if parts.shape[1] != 3:
+        raise ValueError(f"Expected H:M:S durations, got {parts.shape[1]} fields")
+    hours, minutes, seconds = (parts[column].astype("int64") for column in parts.columns)
+    return pd.to_timedelta(hours * 3600 + minutes * 60 + seconds, unit="s")
+
+def to_python_objects(column: pd.Series) -> list:
+    """Converts a typed column to datetime/timedelta objects, with None for missing values."""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        values = column.array.to_pydatetime()
+    elif pd.api.types.is_timedelta64_dtype(column):
+        values = column.array.to_pytimedelta()
+    else:
+        values = column.to_numpy()
+    return [None if value is pd.NaT or value is None else value for value in values]
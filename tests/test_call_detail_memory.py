@@ -0,0 +1,87 @@
+import gc
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from src.CallDetail import CallDetail
+from src.utils import classify_number, parse_call_memo, parse_iso_datetime, parse_phone_number, parse_time_duration
+
+START = datetime(2025, 4, 1)
+CALLS = 5000
+
+
+class DictCallDetail:
+    """A call laid out like CallDetail was before it was slotted: every field
+    parsed into an instance __dict__, timestamps as datetimes and durations as
+    timedeltas. The number type and the charge are shared with the compact
+    call, so this undercounts the old layout slightly."""
+
+    def __init__(self, row: dict, call_detail: CallDetail):
+        self.client = row["client"]
+        self.sequence_id = row["sequence_id"]
+        self.user_name = row["user_name"]
+        self.call_from = parse_phone_number(row["call_from"])
+        self.call_to = parse_phone_number(row["call_to"])
+        self.call_type = row["call_type"]
+        self.dial_start_at = parse_iso_datetime(row["dial_start_at"])
+        self.dial_answered_at = parse_iso_datetime(row["dial_answered_at"])
+        self.dial_end_at = parse_iso_datetime(row["dial_end_at"])
+        self.ringing_time = parse_time_duration(row["ringing_time"])
+        self.call_duration = parse_time_duration(row["call_duration"])
+        self.call_memo = parse_call_memo(row["call_memo"])
+        self.carrier = row["carrier"]
+        self.number_type = classify_number(self.call_to, self.call_type, self.call_from, self.call_to)
+        self.call_charge = call_detail.call_charge
+
+
+def export_rows(calls: int) -> list[dict]:
+    """Dashboard rows as CallDetail gets them, one distinct number and time per call."""
+    return [
+        {
+            "client": "memory-id",
+            "sequence_id": f"d{i}",
+            "user_name": "Operator",
+            "call_from": "81197800082",
+            "call_to": f"0812{i:08d}",
+            "call_type": "Outbound call",
+            "dial_start_at": (START + timedelta(seconds=60 * i)).isoformat() + "+00:00",
+            "dial_answered_at": (START + timedelta(seconds=60 * i + 10)).isoformat() + "+00:00",
+            "dial_end_at": (START + timedelta(seconds=60 * i + 50)).isoformat() + "+00:00",
+            "ringing_time": "00:00:10",
+            "call_duration": "00:00:40",
+            "call_memo": "Promised to pay",
+            "call_charge": "",
+            "carrier": "Atlasat",
+        }
+        for i in range(calls)
+    ]
+
+
+def compact_call(row: dict) -> CallDetail:
+    call_detail = CallDetail(**row)
+    # Read every field, so none is held as export text any more
+    call_detail.to_dict()
+    return call_detail
+
+
+def bytes_per_call(build, rows: list) -> float:
+    """Memory held per call by the calls build makes, measured with tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    calls = [build(row) for row in rows]
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - sys.getsizeof(calls)
+    tracemalloc.stop()
+    return held / len(calls)
+
+
+def test_compact_call_detail_holds_less_memory_than_a_dict_one():
+    rows = export_rows(CALLS)
+    compact = [compact_call(row) for row in rows]
+
+    slotted = bytes_per_call(compact_call, rows)
+    with_dict = bytes_per_call(lambda pair: DictCallDetail(*pair), list(zip(rows, compact)))
+
+    print(f"\nbytes per call: {with_dict:.0f} with a __dict__, {slotted:.0f} slotted")
+    assert not hasattr(compact[0], "__dict__")
+    assert slotted < 0.8 * with_dict
@@ -0,0 +1,230 @@
+import math
+import os
+from datetime import timedelta
+from pathlib import Path
+from random import Random
+
+import pandas as pd
+import pytest
+
+from config import CONFIG
+from src.batch_classification import classify_batch
+from src.CallDetail import CallDetail
+from src.charge_engine import charge_batch
+from src.client_registry import CLIENT_REGISTRY
+from src.csv_processing import CALL_TYPE_MAPPING, read_console_csv, read_dashboard_csv
+from src.FileConfig import Files
+from src.idn_area_codes import EMERGENCY_NUMBERS
+from src.international_rates import INTERNATIONAL_RATES
+from src.TariffPlan import SPECIAL_ZERO_CHARGE_CALLERS
+from src.utils import classify_number, parse_phone_number, to_python_objects
+
+ROOT = Path(__file__).parent.parent
+
+
+def corpus_calls(files) -> pd.DataFrame:
+    """The numbers, call types and durations of every dashboard and console row
+    of a client in the 202504 corpus."""
+    dashboard = read_dashboard_csv(files.dashboard)
+    frames = [
+        pd.DataFrame({
+            "call_to": dashboard["Call to"],
+            "call_from": dashboard["Call from"],
+            "call_type": dashboard["Call type"].astype(object),
+            "call_duration": dashboard["Call duration"],
+        })
+    ]
+    if os.path.exists(files.console):
+        console = read_console_csv(files.console)
+        frames.append(pd.DataFrame({
+            "call_to": console["number"],
+            "call_from": console["used_number"],
+            "call_type": console["call_type"].map(lambda value: CALL_TYPE_MAPPING.get(value, value)).astype(object),
+            "call_duration": pd.to_timedelta(console["duration_of_call_sec"], unit="s"),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("files", [files for files in CONFIG if os.path.exists(ROOT / files.dashboard)], ids=lambda files: files.output)
+def test_charge_batch_matches_scalar_charges_on_corpus(files, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    calls = corpus_calls(files)
+    client_entry = CLIENT_REGISTRY.get(files.client)
+    classified = classify_batch(calls["call_to"], calls["call_type"], calls["call_from"])
+    charges = charge_batch(calls.assign(number_type=classified.number_type), client_entry.files if client_entry else None)
+
+    for row, (call_to, call_from, call_type, duration) in enumerate(
+        zip(calls["call_to"], calls["call_from"], calls["call_type"], to_python_objects(calls["call_duration"]))
+    ):
+        # Without a number type and a charge, the call classifies and charges itself
+        call_detail = CallDetail.from_parsed(
+            client=files.client,
+            client_entry=client_entry,
+            sequence_id="",
+            user_name="",
+            call_from=call_from,
+            call_to=call_to,
+            call_type=call_type,
+            dial_start_at=None,
+            dial_answered_at=None,
+            dial_end_at=None,
+            ringing_time=None,
+            call_duration=duration,
+            call_memo="",
+            carrier=files.carrier,
+        )
+        assert (classified.number_type[row], charges[row]) == (call_detail.number_type, call_detail.call_charge), (
+            f"row {row}: {call_to!r} {call_from!r} {call_type!r} {duration}"
+        )
+
+
+def baseline_call_charge(files, call_to, call_from, call_type: str, number_type: str, duration: timedelta) -> str:
+    """CallDetail.calculate_call_charge as it was before the TariffPlan, rule
+    for rule, to pin the engine against configs the corpus does not have."""
+
+    def per_minute(rate) -> str:
+        return str(math.ceil(duration.total_seconds() / 60) * rate)
+
+    def per_second(rate) -> str:
+        return str(duration.total_seconds() * rate)
+
+    def number_charge(number, allowed_types, rate, rate_type):
+        if call_type in allowed_types and (call_to == number or call_from == number):
+            if rate == 0:
+                rate = 720
+            if rate_type == "per_minute":
+                return per_minute(rate)
+            elif rate_type == "per_second":
+                return per_second(rate)
+        return None
+
+    is_enduser = "enduser" in files.client.lower()
+    call_to = str(call_to or "").strip()
+    call_from = str(call_from or "").strip()
+    call_type = (call_type or "").strip().lower()
+    number_type = number_type.lower() if number_type else ""
+    chargeable_types = [ct.lower() for ct in files.chargeable_call_types] if files.chargeable_call_types else ["outbound call", "predictive dialer"]
+
+    if call_from in SPECIAL_ZERO_CHARGE_CALLERS and files.client == "siemens-id":
+        return "0"
+    if number_type == "internal call":
+        return per_minute(0)
+    if number_type in ["premium call", "toll-free", "split charge"] or number_type in EMERGENCY_NUMBERS.values():
+        return per_minute(1700 + (200 if is_enduser else 0))
+
+    rate_map = INTERNATIONAL_RATES.get(files.carrier.title(), INTERNATIONAL_RATES["Atlasat"])
+    matched_key = next((k for k in rate_map if k.lower() in number_type.lower() or number_type.lower() in k.lower()), None)
+    if matched_key:
+        return per_minute(rate_map[matched_key] + (200 if is_enduser else 0))
+
+    s2c_target = call_to or call_from
+    s2c_list = files.s2c if isinstance(files.s2c, list) else [files.s2c]
+    if s2c_target in s2c_list or number_type == "scancall":
+        if call_type in ["incoming call", "answering machine"] or call_type in chargeable_types:
+            if files.s2c_rate_type == "per_minute":
+                return per_minute(files.s2c_rate)
+            elif files.s2c_rate_type == "per_second":
+                return per_second(files.s2c_rate)
+
+    for number, call_types, rate, rate_type in (
+        (files.number1, files.number1_chargeable_call_types, files.number1_rate, files.number1_rate_type),
+        (files.number2, files.number2_chargeable_call_types, files.number2_rate, files.number2_rate_type),
+    ):
+        result = number_charge(number, [ct.lower() for ct in (call_types or [])], rate or 0, rate_type or "per_minute")
+        if result:
+            return result
+
+    allowed_types = [ct.lower() for ct in files.chargeable_call_types]
+    if not allowed_types or call_type in allowed_types:
+        if files.rate_type == "per_minute":
+            return per_minute(files.rate)
+        elif files.rate_type == "per_second":
+            return per_second(files.rate)
+
+    if call_type in chargeable_types:
+        rate = files.rate if files.rate is not None else 720
+        return per_second(rate) if files.rate_type == "per_second" else per_minute(rate)
+    return per_minute(0)
+
+
+SYNTHETIC_FILES = [
+    # number1 charged per second on inbound calls, number2 with no rate so it
+    # falls back to 720, an S2C number, and the enduser surcharges
+    Files(
+        client="synthetic-enduser-id",
+        dashboard="",
+        console="",
+        output="synthetic-enduser-id.csv",
+        rate=1000,
+        number1="2150001111",
+        number1_rate=1.5,
+        number1_rate_type="per_second",
+        number1_chargeable_call_types=["Inbound call", "Incoming call"],
+        number2="2150002222",
+        number2_chargeable_call_types=["Outbound call"],
+        s2c="2150003333",
+        s2c_rate=300,
+        chargeable_call_types=["Outbound call", "Predictive dialer"],
+    ),
+    # The zero-charge callers only apply to siemens-id
+    Files(
+        client="siemens-id",
+        dashboard="",
+        console="",
+        output="siemens-id.csv",
+        rate=650,
+        number1="2150913403",
+        number1_rate=900,
+        number1_chargeable_call_types=["Outbound call"],
+    ),
+    # The same callers and numbers on another client are charged
+    Files(
+        client="synthetic-id",
+        dashboard="",
+        console="",
+        output="synthetic-id.csv",
+        carrier="Indosat",
+        rate=12.5,
+        rate_type="per_second",
+        number1="2150913403",
+        number1_rate=900,
+        number1_chargeable_call_types=["Outbound call"],
+        number2="85161662298",
+        number2_rate=450,
+        number2_rate_type="per_second",
+        number2_chargeable_call_types=["Outbound call", "Predictive dialer", "Answering machine"],
+        s2c="2150003333",
+        s2c_rate=2,
+        s2c_rate_type="per_second",
+        chargeable_call_types=["Predictive dialer"],
+    ),
+]
+SYNTHETIC_NUMBERS = [
+    "2150001111", "2150002222", "2150003333", *sorted(SPECIAL_ZERO_CHARGE_CALLERS),
+    "081234567890", "+62 21-5000-1111", "+14155550100", "+442079460000", "0800123456", "112", "110", "1001", "0809123456",
+]
+SYNTHETIC_CALL_TYPES = [
+    "Outbound call", "Inbound call", "Incoming call", "Answering machine", "Predictive dialer",
+    "Internal Call", "Outbound call (No answer)", "Monitoring",
+]
+
+
+@pytest.mark.parametrize("files", SYNTHETIC_FILES, ids=lambda files: files.client)
+def test_charge_batch_matches_baseline_charges_on_synthetic_configs(files):
+    random = Random(files.client)
+    calls = pd.DataFrame({
+        "call_to": [parse_phone_number(random.choice(SYNTHETIC_NUMBERS)) for _ in range(3000)],
+        "call_from": [parse_phone_number(random.choice(SYNTHETIC_NUMBERS)) for _ in range(3000)],
+        "call_type": [random.choice(SYNTHETIC_CALL_TYPES) for _ in range(3000)],
+        "call_duration": pd.to_timedelta([random.choice([0, 1, 59, 60, 61, random.randrange(600)]) for _ in range(3000)], unit="s"),
+    })
+    classified = classify_batch(calls["call_to"], calls["call_type"], calls["call_from"])
+    charges = charge_batch(calls.assign(number_type=classified.number_type), files)
+
+    for row, (call_to, call_from, call_type, duration) in enumerate(
+        zip(calls["call_to"], calls["call_from"], calls["call_type"], to_python_objects(calls["call_duration"]))
+    ):
+        number_type = classify_number(call_to, call_type, call_from, call_to)
+        assert charges[row] == baseline_call_charge(files, call_to, call_from, call_type, number_type, duration), (
+            f"row {row}: {call_to!r} {call_from!r} {call_type!r} {number_type!r} {duration}"
+        )
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from src.csv_processing import process_console_csv, process_dashboard_csv, save_merged_csv
+
+DASHBOARD_ROW = {
+    "Sequence ID": "d1",
+    "User name": "Operator",
+    "Call from": "81197800082",
+    "Call to": "081234567890",
+    "Call type": "Outbound call",
+    "Dial begin time": "2025-04-01T03:00:00.250000+00:00",
+    "Call begin time": "2025-04-01T03:00:10.250000+00:00",
+    "Call end time": "2025-04-01T03:01:10.250000+00:00",
+    "Ringing time": "00:00:10",
+    "Call duration": "00:01:00",
+    "Call memo": "Promised to pay",
+}
+CONSOLE_ROW = {
+    "pbx_region": "jkt",
+    "call_type": "OUTGOING_CALL",
+    "number": "+6281298765432",
+    "used_number": "081197800082",
+    "all_duration_of_call_sec_str": "00:00:35",
+    "duration_of_call_sec": 5,
+    "duration_of_call_sec_str": "00:00:05",
+    "dial_starts_at": "2025-04-01 04:00:00",
+    "dial_answered_at": "2025-04-01 04:00:30",
+    "dial_ends_at": "2025-04-01 04:00:35",
+    "discount": 0.0,
+    "call_id": "c1",
+}
+
+
+def merge(tmp_path, dashboard_rows: list[dict], console_rows: list[dict], columnar: bool = True, **kwargs) -> pd.DataFrame:
+    """The merged CSV of the exports, read back as text."""
+    dashboard_path, console_path, output_path = tmp_path / "dashboard.csv", tmp_path / "console.csv", tmp_path / "out.csv"
+    pd.DataFrame(dashboard_rows).to_csv(dashboard_path)
+    pd.DataFrame(console_rows).to_csv(console_path, index=False)
+    call_details = process_dashboard_csv(str(dashboard_path), "Atlasat", columnar=columnar)
+    call_details = process_console_csv(str(console_path), "Atlasat", call_details, columnar=columnar, **kwargs)
+    save_merged_csv(call_details, str(output_path))
+    return pd.read_csv(output_path, dtype=str, keep_default_na=False)
+
+
+@pytest.mark.parametrize("columnar", [True, False])
+def test_second_console_row_of_a_call_updates_it(tmp_path, columnar):
+    again = {
+        **CONSOLE_ROW,
+        "call_type": "OUTGOING_CALL_ABSENCE",
+        "all_duration_of_call_sec_str": "00:01:20",
+        "duration_of_call_sec": 65,
+        "duration_of_call_sec_str": "00:01:05",
+        "dial_answered_at": "2025-04-01 04:00:15",
+        "dial_ends_at": "2025-04-01 04:01:20",
+        "discount": 9.5,
+    }
+    merged = merge(tmp_path, [DASHBOARD_ROW], [CONSOLE_ROW, again], columnar=columnar)
+
+    call = merged[merged["Sequence ID"] == "c1"].squeeze()
+    assert len(merged) == 2
+    assert call["Call type"] == "Outbound call (No answer)"
+    # Console times are in the PBX region's time, Jakarta for jkt
+    assert call["Dial starts at"] == "2025-04-01 11:00:00"
+    assert call["Dial answered at"] == "2025-04-01 11:00:15"
+    assert call["Dial ends at"] == "2025-04-01 11:01:20"
+    assert call["Ringing time"] == "0:01:20"
+    assert call["Call duration"] == "0:01:05"
+    assert call["Round up duration"] == "2"
+    assert call["Call charge"] == "9.5"
+
+
+def test_tolerant_match_takes_only_the_console_timings(tmp_path):
+    # The same call, a quarter second apart and in Jakarta time on the console
+    console_row = {
+        **CONSOLE_ROW,
+        "call_type": "OUTGOING_CALL_ABSENCE",
+        "number": "+6281234567890",
+        "all_duration_of_call_sec_str": "00:00:30",
+        "duration_of_call_sec": 125,
+        "duration_of_call_sec_str": "00:02:05",
+        "dial_starts_at": "2025-04-01 03:00:00",
+        "dial_answered_at": "2025-04-01 03:00:20",
+        "dial_ends_at": "2025-04-01 03:02:25",
+        "discount": 7.0,
+    }
+    merged = merge(tmp_path, [DASHBOARD_ROW], [console_row], match_tolerance=timedelta(seconds=1))
+
+    call = merged.squeeze()
+    assert len(merged) == 1
+    assert (call["Sequence ID"], call["User name"], call["Call memo"]) == ("d1", "Operator", "Promised to pay")
+    assert call["Call type"] == "Outbound call"
+    # Console times are shown in the UTC offset of the dashboard call
+    assert call["Dial starts at"] == "2025-04-01 03:00:00"
+    assert call["Dial answered at"] == "2025-04-01 03:00:20"
+    assert call["Dial ends at"] == "2025-04-01 03:02:25"
+    assert call["Ringing time"] == "0:00:30"
+    assert call["Call duration"] == "0:02:05"
+    # Charged on the console duration with the tariff, 720 per started minute
+    # without a client, not with the console discount
+    assert call["Call charge"] == "2160"
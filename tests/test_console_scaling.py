@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from src.call_batch import CallBatch
+from src.CallDetail import CallDetail
+from src.csv_processing import process_console_csv, process_dashboard_csv
+
+START = datetime(2025, 4, 1)
+
+
+def write_exports(directory, calls: int) -> tuple[str, str]:
+    """A dashboard export with calls calls and a console export with as many
+    rows, half of them for dashboard calls and half for new ones. Console keys
+    never match dashboard keys, so every console row goes through the
+    sequence ID check."""
+    dashboard = pd.DataFrame({
+        "Sequence ID": [f"d{i}" for i in range(calls)],
+        "User name": "Operator",
+        "Call from": "81197800082",
+        "Call to": [f"0812{i:08d}" for i in range(calls)],
+        "Call type": "Outbound call",
+        "Dial begin time": [(START + timedelta(seconds=60 * i)).isoformat() + "+00:00" for i in range(calls)],
+        "Call begin time": "-",
+        "Call end time": [(START + timedelta(seconds=60 * i + 30)).isoformat() + "+00:00" for i in range(calls)],
+        "Ringing time": "00:00:30",
+        "Call duration": "00:00:00",
+        "Call memo": "memo",
+    })
+    console = pd.DataFrame({
+        "pbx_region": "jkt",
+        "call_type": "OUTGOING_CALL",
+        "number": [f"+62812{i:08d}" for i in range(calls)],
+        "used_number": "081197800082",
+        "all_duration_of_call_sec_str": "00:00:30",
+        "duration_of_call_sec": 5,
+        "duration_of_call_sec_str": "00:00:05",
+        "dial_starts_at": [str(START + timedelta(hours=7, seconds=60 * i)) for i in range(calls)],
+        "dial_answered_at": [str(START + timedelta(hours=7, seconds=60 * i + 25)) for i in range(calls)],
+        "dial_ends_at": [str(START + timedelta(hours=7, seconds=60 * i + 30)) for i in range(calls)],
+        "discount": 0.0,
+        "call_id": [f"d{i}" if i % 2 else f"c{i}" for i in range(calls)],
+    })
+    dashboard_path, console_path = directory / f"dashboard-{calls}.csv", directory / f"console-{calls}.csv"
+    dashboard.to_csv(dashboard_path)
+    console.to_csv(console_path, index=False)
+    return str(dashboard_path), str(console_path)
+
+
+def sequence_id_reads(monkeypatch, dashboard_path: str, console_path: str, columnar: bool) -> tuple[int, int]:
+    """Sequence IDs of known calls read during the console merge, and the calls
+    merged. The columnar merge reads them all when it indexes the CallBatch,
+    the row-by-row merge through CallDetail.sequence_id."""
+    call_details = process_dashboard_csv(dashboard_path, "Atlasat", columnar=columnar)
+    reads = 0
+
+    with monkeypatch.context() as patch:
+        if columnar:
+            index = CallBatch.sequence_ids
+
+            def read_all(batch):
+                nonlocal reads
+                reads += len(batch)
+                return index(batch)
+
+            patch.setattr(CallBatch, "sequence_ids", read_all)
+        else:
+            slot = CallDetail.__dict__["sequence_id"]
+
+            def read(call_detail):
+                nonlocal reads
+                reads += 1
+                return slot.__get__(call_detail)
+
+            patch.setattr(CallDetail, "sequence_id", property(read, slot.__set__))
+        call_details = process_console_csv(console_path, "Atlasat", call_details, columnar=columnar)
+    return reads, len(call_details)
+
+
+@pytest.mark.parametrize("columnar", [True, False])
+def test_console_merge_checks_sequence_ids_in_linear_time(tmp_path, monkeypatch, columnar):
+    small, calls_small = sequence_id_reads(monkeypatch, *write_exports(tmp_path, 500), columnar)
+    large, calls_large = sequence_id_reads(monkeypatch, *write_exports(tmp_path, 2000), columnar)
+
+    # Every dashboard call, plus every console row for a new call
+    assert calls_small == 500 + 250
+    assert calls_large == 2000 + 1000
+    # Scanning every call for every console row would read 16 times as many
+    # IDs for 4 times the rows, an index reads each call once
+    assert small <= 500
+    assert large <= 4 * small